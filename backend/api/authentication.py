@@ -0,0 +1,50 @@
+import copy
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import LRUCache, bump_version, get_version
+from .constants import TOKEN_USER_VERSION
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кешем token -> пользователь в памяти процесса.
+
+    Вместе с пользователем запоминается его версия из общего кеша Django,
+    и каждое попадание сверяет её с текущей. Выход, смена пароля
+    и деактивация меняют версию (см. api.signals), поэтому отозванный
+    токен сразу перестаёт работать во всех процессах.
+    """
+
+    cache = LRUCache(
+        settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT
+    )
+
+    def authenticate_credentials(self, key):
+        cached = self.cache.get(key)
+        if cached is not None:
+            user, token, version = cached
+            if version != get_version(TOKEN_USER_VERSION.format(user.pk)):
+                cached = None
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            cached = (
+                user, token,
+                get_version(TOKEN_USER_VERSION.format(user.pk)),
+            )
+            self.cache.set(key, cached)
+        user, token, _ = cached
+        # Каждый запрос получает свою копию, чтобы изменения
+        # пользователя во view не попадали в общий кеш.
+        return copy.copy(user), token
+
+    @classmethod
+    def revoke(cls, user_id):
+        """Сбрасывает закешированные токены пользователя во всех процессах.
+
+        Версия меняется после коммита, иначе другой процесс успел бы
+        закешировать ещё старое состояние пользователя под новой версией.
+        """
+        name = TOKEN_USER_VERSION.format(user_id)
+        transaction.on_commit(lambda: bump_version(name))
@@ -0,0 +1,276 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipe.models import Recipe, Tag
+from .constants import (CHANGE_LOG_KEY, INGREDIENTS_VERSION,
+                        RECIPE_REPRESENTATION_KEY,
+                        RECIPE_REPRESENTATION_VERSION, SHORT_LINK_CACHE_KEY,
+                        SHORT_LINK_MISSING, TAG_MAP_CACHE_KEY, TAGS_VERSION)
+
+VERSION_KEY = 'version:{}'
+
+
+def get_version(name):
+    """Текущая версия набора данных name для ключей кеша."""
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        # Стартуем с метки времени, чтобы после вытеснения ключа
+        # не вернуться к уже использованной версии.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def get_versions(names):
+    """get_version для нескольких наборов за одно обращение к кешу."""
+    keys = {name: VERSION_KEY.format(name) for name in names}
+    found = cache.get_many(keys.values())
+    return {
+        name: found[key] if key in found else get_version(name)
+        for name, key in keys.items()
+    }
+
+
+def bump_version(name):
+    """Инвалидирует все ключи кеша, построенные на версии name."""
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return reset_version(name)
+
+
+def reset_version(name):
+    """Новая версия name, далёкая от прежней: журналы по ней не читаются."""
+    version = time.time_ns()
+    cache.set(VERSION_KEY.format(name), version, None)
+    return version
+
+
+def get_tag_map():
+    """Словарь {slug: id} всех тегов, общий для воркеров через кеш."""
+    key = TAG_MAP_CACHE_KEY.format(get_version(TAGS_VERSION))
+    tag_map = cache.get(key)
+    if tag_map is None:
+        tag_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_map, settings.REFERENCE_CACHE_TIMEOUT)
+    return tag_map
+
+
+def get_tag_ids(slugs, match_all=False):
+    """id тегов по слагам; пустое множество, если ничего не подойдёт.
+
+    При match_all неизвестный слаг означает, что подходящих рецептов нет.
+    """
+    tag_map = get_tag_map()
+    tag_ids = {tag_map[slug] for slug in slugs if slug in tag_map}
+    if match_all and len(tag_ids) < len(set(slugs)):
+        return set()
+    return tag_ids
+
+
+class ChangeLog:
+    """Журнал изменённых объектов в общем кеше.
+
+    Каждая запись увеличивает версию name на единицу и кладёт pk под
+    ключ этой версии. Индекс в памяти, отстающий на несколько версий,
+    дочитывает только изменённые объекты; если запись вытеснена или
+    версия сброшена через bump_version, changes_since возвращает None
+    и индекс строится заново.
+
+    Журнал рассчитан на атомарный cache.incr (Memcached, Redis). У
+    FileBasedCache и баз данных incr — это get и set, и два процесса
+    могут получить один номер; тогда ключ номера уже занят, и версия
+    сбрасывается, чтобы индексы перестроились, а не потеряли запись.
+    """
+
+    def __init__(self, name, max_changes):
+        self.name = name
+        self.max_changes = max_changes
+
+    def get_version(self):
+        return get_version(self.name)
+
+    def record(self, pk):
+        version = bump_version(self.name)
+        if not cache.add(
+            CHANGE_LOG_KEY.format(self.name, version), pk,
+            settings.CHANGE_LOG_TIMEOUT
+        ):
+            reset_version(self.name)
+
+    def changes_since(self, version, current):
+        """Множество pk, изменённых после version, или None."""
+        if version is None or not 0 <= current - version <= self.max_changes:
+            return None
+        keys = [
+            CHANGE_LOG_KEY.format(self.name, number)
+            for number in range(version + 1, current + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set(changes.values())
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кеш процесса с ограничением по времени жизни."""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ShortLinkCache:
+    """Кеш short_link -> id рецепта: LRU процесса поверх кеша Django.
+
+    Несуществующие коды тоже кешируются (SHORT_LINK_MISSING) на короткое
+    время, чтобы перебор кодов не доходил до БД.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(
+            settings.SHORT_LINK_LOCAL_CACHE_SIZE,
+            settings.SHORT_LINK_LOCAL_CACHE_TIMEOUT,
+        )
+
+    def resolve(self, short_code):
+        """id рецепта по короткому коду или None."""
+        recipe_id = self.local.get(short_code)
+        if recipe_id is None:
+            key = SHORT_LINK_CACHE_KEY.format(short_code)
+            recipe_id = cache.get(key)
+            if recipe_id is None:
+                recipe_id = Recipe.objects.filter(
+                    short_link=short_code
+                ).values_list('id', flat=True).first()
+                if recipe_id is None:
+                    recipe_id = SHORT_LINK_MISSING
+                    cache.set(
+                        key, recipe_id, settings.SHORT_LINK_NEGATIVE_TIMEOUT
+                    )
+                else:
+                    cache.set(key, recipe_id, settings.SHORT_LINK_TIMEOUT)
+            self.local.set(short_code, recipe_id)
+
+        return None if recipe_id == SHORT_LINK_MISSING else recipe_id
+
+    def store(self, short_code, recipe_id):
+        cache.set(
+            SHORT_LINK_CACHE_KEY.format(short_code), recipe_id,
+            settings.SHORT_LINK_TIMEOUT
+        )
+        self.local.set(short_code, recipe_id)
+
+    def forget(self, short_code):
+        self.forget_many((short_code, ))
+
+    def forget_many(self, short_codes):
+        """LRU других процессов забудет коды через
+        SHORT_LINK_LOCAL_CACHE_TIMEOUT."""
+        cache.delete_many([
+            SHORT_LINK_CACHE_KEY.format(short_code)
+            for short_code in short_codes
+        ])
+        for short_code in short_codes:
+            self.local.delete(short_code)
+
+
+short_link_cache = ShortLinkCache()
+
+
+class RecipeRepresentationCache:
+    """Не зависящая от зрителя часть RecipeReadSerializer по id рецепта.
+
+    Запись хранится со штампом из базового URL (ссылки на картинки
+    абсолютные), версий тегов и ингредиентов и версии самого рецепта.
+    Штампы читаются до загрузки промахов из БД, а версия рецепта
+    повышается после коммита правки, поэтому гонка чтения с записью
+    оставляет в кеше только запись со старым, уже невалидным штампом.
+    """
+
+    def get_stamps(self, recipe_ids, base_url):
+        names = {
+            recipe_id: RECIPE_REPRESENTATION_VERSION.format(recipe_id)
+            for recipe_id in recipe_ids
+        }
+        versions = get_versions(
+            (TAGS_VERSION, INGREDIENTS_VERSION, *names.values())
+        )
+        common = (
+            base_url, versions[TAGS_VERSION], versions[INGREDIENTS_VERSION]
+        )
+        return {
+            recipe_id: (*common, versions[name])
+            for recipe_id, name in names.items()
+        }
+
+    def get_many(self, stamps):
+        """{id: представление} для рецептов с актуальной записью."""
+        entries = cache.get_many(
+            [RECIPE_REPRESENTATION_KEY.format(pk) for pk in stamps]
+        )
+        result = {}
+        for recipe_id, stamp in stamps.items():
+            entry = entries.get(RECIPE_REPRESENTATION_KEY.format(recipe_id))
+            if entry is not None and entry[0] == stamp:
+                result[recipe_id] = entry[1]
+        return result
+
+    def set_many(self, representations, stamps):
+        cache.set_many(
+            {
+                RECIPE_REPRESENTATION_KEY.format(recipe_id): (
+                    stamps[recipe_id], data
+                )
+                for recipe_id, data in representations.items()
+            },
+            settings.RECIPE_REPRESENTATION_TIMEOUT
+        )
+
+    def forget_on_commit(self, recipe_ids):
+        recipe_ids = tuple(recipe_ids)
+
+        def forget():
+            for recipe_id in recipe_ids:
+                bump_version(RECIPE_REPRESENTATION_VERSION.format(recipe_id))
+
+        transaction.on_commit(forget)
+
+
+recipe_representations = RecipeRepresentationCache()
@@ -0,0 +1,117 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from .metrics import timed_serialization
+from .utils import ImageRenditionsField, get_file_url
+
+# Поля, которые DRF отдаёт как есть: значения из .values() уже нужного типа.
+PLAIN_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.ReadOnlyField,
+)
+
+
+class CompiledSerializer:
+    """Read-only сериализация строк .values() по полям ModelSerializer.
+
+    Поля serializer_class разбираются один раз: для каждого заранее
+    выбирается функция, которая достаёт значение из строки и приводит его
+    к тому виду, в каком его отдал бы сам сериализатор. На чтении нет
+    get_attribute, SkipField и OrderedDict на каждое поле, поэтому
+    справочники и краткие рецепты сериализуются в разы быстрее.
+
+    Поддерживаются простые поля модели, ImageField и ImageRenditionsField,
+    на остальных разбор падает с ImproperlyConfigured.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @property
+    def values(self):
+        """Поля модели для queryset.values(*values)."""
+        return self._compiled[0]
+
+    def serialize(self, rows, request=None):
+        """Список представлений для строк queryset.values(*self.values)."""
+        accessors = self._compiled[1]
+        with timed_serialization():
+            return [
+                {name: get(row, request) for name, get in accessors}
+                for row in rows
+            ]
+
+    def serialize_one(self, row, request=None):
+        return self.serialize((row, ), request)[0]
+
+    def serialize_instance(self, instance, request=None):
+        """Представление уже загруженного объекта модели."""
+        return self.serialize_one({
+            name: getattr(instance, name) for name in self.values
+        }, request)
+
+    @cached_property
+    def _compiled(self):
+        model = self.serializer_class.Meta.model
+        values, accessors = [], []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, ImageRenditionsField):
+                sources = (
+                    field.image_field, f'{field.image_field}_renditions'
+                )
+                accessor = self._get_renditions(*sources)
+            elif '.' in field.source or field.source == '*':
+                raise ImproperlyConfigured(
+                    f'{self.serializer_class.__name__}.{name}: '
+                    'поддерживаются только поля самой модели.'
+                )
+            elif isinstance(field, serializers.FileField):
+                sources = (field.source, )
+                accessor = self._get_file(
+                    field.source, model._meta.get_field(field.source).storage,
+                    getattr(
+                        field, 'use_url', api_settings.UPLOADED_FILES_USE_URL
+                    ),
+                )
+            elif isinstance(field, PLAIN_FIELDS):
+                sources = (field.source, )
+                accessor = self._get_plain(field.source)
+            else:
+                raise ImproperlyConfigured(
+                    f'{self.serializer_class.__name__}.{name}: '
+                    f'{type(field).__name__} не поддерживается.'
+                )
+            values.extend(
+                source for source in sources if source not in values
+            )
+            accessors.append((name, accessor))
+        return tuple(values), tuple(accessors)
+
+    @staticmethod
+    def _get_plain(source):
+        return lambda row, request: row[source]
+
+    @staticmethod
+    def _get_file(source, storage, use_url):
+        def get(row, request):
+            # У загруженного объекта модели вместо имени — FieldFile.
+            name = getattr(row[source], 'name', row[source])
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = get_file_url(name, storage)
+            return request.build_absolute_uri(url) if request else url
+        return get
+
+    @staticmethod
+    def _get_renditions(image_field, renditions_field):
+        def get(row, request):
+            image = row[image_field]
+            return ImageRenditionsField.get_urls(
+                getattr(image, 'name', image), row[renditions_field], request
+            )
+        return get
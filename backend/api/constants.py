@@ -26,7 +26,15 @@ ING_NAME_LENGTH = 128
 
 ING_MU_LENGTH = 64
 
-SHORT_LINK_LENGTH = 6
+SHORT_LINK_LENGTH = 7
+
+SHORT_LINK_ALPHABET = (
+    '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+)
+
+# Взаимно просто с 62, поэтому умножение по модулю 62 ** 7 — биекция;
+# близко к 62 ** 7 / φ, чтобы соседние pk давали непохожие коды.
+SHORT_LINK_MULTIPLIER = 2_176_477_521_915
 
 AMOUNT_MIN_VALUE = 1
 
@@ -39,6 +47,125 @@ PAGINATION_PAGE_SIZE = 6
 
 PAGE_SIZE_QUERY_PARAM = 'limit'
 
+CURSOR_QUERY_PARAM = 'cursor'
+
+# Shopping list
+SHOPPING_LIST_FILENAME = 'Shopping_list'
+
+SHOPPING_LIST_CHUNK_SIZE = 2000
+
+SHOPPING_CART_VERSION = 'shopping_cart:{}'
+
+SHOPPING_LIST_VERSION = 'shopping_list'
+
+SHOPPING_LIST_CACHE_KEY = 'shopping_list:{user}:{format}:{list}:{cart}'
+
+# Ingredient autocomplete
+INGREDIENTS_VERSION = 'ingredients'
+
+INGREDIENT_SEARCH_PARAM = 'name'
+
+INGREDIENT_LIMIT_PARAM = 'limit'
+
+# Reference data HTTP cache
+TAGS_VERSION = 'tags'
+
+REFERENCE_CACHE_KEY = 'reference_response:{name}:{version}:{path}'
+
+# Recipe representation cache
+RECIPE_REPRESENTATION_KEY = 'recipe_representation:{}'
+
+RECIPE_REPRESENTATION_VERSION = 'recipe_representation:{}'
+
+# Recipe tag filter
+TAG_MAP_CACHE_KEY = 'tag_map:{}'
+
+TAGS_MODE_ANY = 'any'
+
+TAGS_MODE_ALL = 'all'
+
+# Recipe full-text search
+RECIPES_VERSION = 'recipes'
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+RECIPE_SEARCH_LIMIT = 500
+
+RECIPE_SEARCH_NAME_WEIGHT = 1.0
+
+RECIPE_SEARCH_TEXT_WEIGHT = 0.4
+
+RECIPE_SEARCH_MIN_STEM = 3
+
+RECIPE_SEARCH_ENDINGS = (
+    'иями', 'ями', 'ами', 'его', 'ого', 'ему', 'ому', 'ыми', 'ими', 'иях',
+    'ях', 'ах', 'ов', 'ев', 'ей', 'ой', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ую', 'юю', 'ом', 'ем', 'ам', 'ям', 'ью', 'ия', 'ть', 'ти',
+    'ет', 'ит', 'ут', 'ют', 'ат', 'ят', 'а', 'я', 'о', 'е', 'ы', 'и', 'у',
+    'ю', 'ь', 'й',
+)
+
+# In-memory recipe indexes: "what can I cook" and search without PostgreSQL
+RECIPE_CHANGES_VERSION = 'recipe_changes'
+
+RECIPE_CHANGES_MAX = 1000
+
+CHANGE_LOG_KEY = 'change_log:{}:{}'
+
+COOKABLE_INGREDIENTS_PARAM = 'ingredients'
+
+COOKABLE_LIMIT_MAX = 100
+
+# Знаков после запятой: доли от 0.0001 до 1 stdlib json и orjson
+# пишут одинаково, без экспоненты.
+COOKABLE_COVERAGE_DIGITS = 4
+
+# Image renditions, largest first: each one is resized from the previous
+IMAGE_RENDITIONS = {
+    'full': (1280, 1280),
+    'card': (480, 480),
+    'thumb': (160, 160),
+}
+
+IMAGE_FORMATS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+IMAGE_QUALITY = 80
+
+IMAGE_RENDITIONS_DIR = 'renditions'
+
+IMAGE_SOURCE_KEY = 'source'
+
+# Base64 image uploads
+DATA_URL_PREFIX = 'data:image/'
+
+BASE64_SEPARATOR = ';base64,'
+
+DATA_URL_HEADER_MAX_LENGTH = 64
+
+BASE64_CHUNK_SIZE = 64 * 1024
+
+# Data imports: a record of recipes.json may contain a base64 image
+IMPORT_MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+# Request metrics
+METRICS_PREFIX = 'foodgram'
+
+METRICS_KEY = 'metrics:{view}:{field}'
+
+METRICS_VIEW_KEY = 'metrics:view:{view}'
+
+METRICS_VIEWS_KEY = 'metrics:views:{number}'
+
+METRICS_VIEWS_COUNT_KEY = 'metrics:views:count'
+
+# Token authentication cache
+TOKEN_USER_VERSION = 'token_user:{}'
+
+# Short links
+SHORT_LINK_CACHE_KEY = 'short_link:{}'
+
+SHORT_LINK_MISSING = 0
+
 # Admin
 TAG_INLINE_MIN_VALUE = 1
 
@@ -0,0 +1,56 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+from django.db import connections, router
+
+from recipe.models import FeedItem
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """Один поток: рассылки выполняются по очереди и не спорят за БД."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(1, thread_name_prefix='feeds')
+    return _executor
+
+
+def submit_fan_out(recipe):
+    """Рассылка рецепта по лентам; возвращает Future.
+
+    Рецепт автора, у которого подписчиков не больше
+    FEED_FANOUT_MAX_FOLLOWERS, рассылается сразу, рецепт популярного
+    автора — в фоновом потоке, чтобы публикация не ждала вставки
+    строк для всех подписчиков. SQLite не допускает параллельных
+    записей, там рассылка всегда идёт в текущем потоке.
+    """
+    if (
+        connections[router.db_for_write(FeedItem)].vendor == 'sqlite'
+        or not FeedItem.objects.is_popular(recipe.author_id)
+    ):
+        future = Future()
+        future.set_result(_fan_out(recipe))
+        return future
+    return get_executor().submit(_fan_out_in_worker, recipe)
+
+
+def _fan_out(recipe):
+    try:
+        return FeedItem.objects.fan_out(recipe)
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s по лентам', recipe.pk)
+        return 0
+
+
+def _fan_out_in_worker(recipe):
+    try:
+        return _fan_out(recipe)
+    finally:
+        connections.close_all()
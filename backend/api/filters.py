@@ -1,22 +1,112 @@
+from django import forms
+from django.db.models import Exists, OuterRef
+from django_filters.constants import EMPTY_VALUES
 from django_filters.rest_framework import FilterSet, filters
 
 from recipe.models import Recipe, Ingredient
+from .cache import get_tag_ids
+from .constants import TAGS_MODE_ALL, TAGS_MODE_ANY
+from .search import search_recipes
+
+
+class SlugsField(forms.MultipleChoiceField):
+    """Список слагов без проверки по choices: теги берутся из кеша."""
+
+    def valid_value(self, value):
+        return True
+
+
+class SlugsFilter(filters.Filter):
+    field_class = SlugsField
+
+
+class StableOrderingFilter(filters.OrderingFilter):
+    """Сортировка с pub_date и id в конце для равных значений.
+
+    Без них у рецептов с одинаковым favorites_count нет определённого
+    порядка, и соседние страницы повторяют или теряют рецепты.
+    Направление добавленных полей совпадает с первым полем сортировки,
+    чтобы её обслуживал один индекс.
+    """
+
+    tie_breakers = ('pub_date', 'id')
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        used = {field.lstrip('-') for field in ordering}
+        prefix = '-' if ordering[0].startswith('-') else ''
+        return qs.order_by(*ordering, *(
+            f'{prefix}{field}' for field in self.tie_breakers
+            if field not in used
+        ))
 
 
 class RecipeFilter(FilterSet):
 
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = SlugsFilter(method='tags_filter')
+    tags_mode = filters.ChoiceFilter(
+        choices=((TAGS_MODE_ANY, TAGS_MODE_ANY),
+                 (TAGS_MODE_ALL, TAGS_MODE_ALL)),
+        method='tags_mode_filter',
     )
     is_favorited = filters.BooleanFilter(method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
     author = filters.CharFilter(field_name='author__id')
+    search = filters.CharFilter(method='search_filter')
+    ordering = StableOrderingFilter(
+        fields=(
+            ('favorites_count', 'popularity'),
+            ('pub_date', 'pub_date'),
+        )
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'tags_mode', 'author', 'is_favorited',
+            'is_in_shopping_cart', 'search', 'ordering'
+        )
+
+    def tags_filter(self, queryset, name, value):
+        """Рецепты с любым (или со всеми при tags_mode=all) из тегов.
+
+        Слаги переводятся в id по кешированной карте тегов, а связь
+        проверяется через EXISTS, поэтому JOIN с recipe_tags не
+        размножает строки рецептов и DISTINCT не нужен.
+        """
+        if not value:
+            return queryset
+        match_all = self.form.cleaned_data.get('tags_mode') == TAGS_MODE_ALL
+        tag_ids = get_tag_ids(value, match_all)
+        if not tag_ids:
+            return queryset.none()
+
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk')
+        )
+        if not match_all:
+            return queryset.filter(
+                Exists(recipe_tags.filter(tag_id__in=tag_ids))
+            )
+        for tag_id in tag_ids:
+            queryset = queryset.filter(
+                Exists(recipe_tags.filter(tag_id=tag_id))
+            )
+        return queryset
+
+    def search_filter(self, queryset, name, value):
+        """Полнотекстовый поиск; порядок по релевантности, если не задан."""
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
+    def tags_mode_filter(self, queryset, name, value):
+        """Режим учитывается в tags_filter."""
+        return queryset
 
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
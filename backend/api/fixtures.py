@@ -0,0 +1,306 @@
+"""Синтетический набор данных для бенчмарков и нагрузочных тестов."""
+import csv
+import io
+import random
+from bisect import bisect
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate, count, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from recipe.models import (Favorite, FeedItem, Ingredient, IngredientRecipe,
+                           Recipe, ShoppingCart, ShoppingListItem, Tag,
+                           encode_short_link)
+from users.models import Follow
+from .cache import bump_version
+from .constants import (INGREDIENTS_VERSION, RECIPE_CHANGES_VERSION,
+                        RECIPES_VERSION, SHOPPING_LIST_VERSION, TAGS_VERSION)
+
+User = get_user_model()
+
+FIXTURE_PASSWORD = 'fixture-password'
+
+# Показатель степени для популярности ингредиентов, тегов, авторов
+# и рецептов: вес k-го по популярности объекта пропорционален 1 / k ** s.
+ZIPF_EXPONENT = 1.1
+
+# Число подписок, избранного и корзин у пользователя распределено
+# по Парето с этим параметром, среднее задаётся отдельно.
+PARETO_ALPHA = 1.5
+
+COPY_NULL = r'\N'
+
+WORDS = (
+    'абрикос', 'базилик', 'баранина', 'брокколи', 'говядина', 'горох',
+    'грибы', 'имбирь', 'индейка', 'капуста', 'картофель', 'кинза',
+    'лосось', 'лук', 'масло', 'миндаль', 'морковь', 'мука', 'мёд',
+    'перец', 'петрушка', 'рис', 'сахар', 'свёкла', 'сливки', 'сметана',
+    'сыр', 'томат', 'тыква', 'укроп', 'фасоль', 'чеснок', 'яблоко', 'яйцо',
+)
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+class ZipfSampler:
+    """Выбор из совокупности с весами по закону Ципфа.
+
+    Порядок популярности перемешивается, чтобы она не зависела от pk.
+    """
+
+    def __init__(self, population, exponent, rng):
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)
+        ))
+
+    def choice(self, rng):
+        return self.population[
+            bisect(self.cum_weights, rng.random() * self.cum_weights[-1])
+        ]
+
+    def sample(self, rng, k):
+        """k различных элементов, популярные выпадают чаще."""
+        k = min(k, len(self.population))
+        if k * 2 > len(self.population):
+            return rng.sample(self.population, k)
+        chosen = {}
+        while len(chosen) < k:
+            chosen.setdefault(self.choice(rng))
+        return list(chosen)
+
+
+def generate_dataset(
+    users, recipes, ingredients=1000, tags=10, follows=10, favorites=20,
+    carts=5, recipe_ingredients=8, recipe_tags=2, seed=0,
+    exponent=ZIPF_EXPONENT, batch_size=10000, feeds=True,
+):
+    """Создаёт связанный набор пользователей, рецептов и связей.
+
+    Строки пишутся пачками через COPY на PostgreSQL и bulk_create
+    на остальных БД с заранее выданными pk, поэтому сигналы
+    не срабатывают: счётчики рецептов и ленты подписок считаются здесь
+    же, агрегат списков покупок пересобирается в конце. Один и тот же
+    seed даёт одни и те же данные. Возвращает словарь {модель: количество}.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    created = {}
+
+    def write(model, fields, rows):
+        created[model] = _write(model, fields, rows, batch_size)
+
+    user_ids = _reserve(User, users)
+    password = make_password(FIXTURE_PASSWORD)
+    write(User, (
+        'id', 'email', 'username', 'first_name', 'last_name', 'password',
+    ), (
+        (
+            pk, f'user{pk}@example.com', f'user{pk}',
+            rng.choice(WORDS).title(), rng.choice(WORDS).title(), password,
+        )
+        for pk in user_ids
+    ))
+    tag_ids = _reserve(Tag, tags)
+    write(Tag, ('id', 'name', 'slug'), (
+        (pk, f'Тег {pk}', f'tag-{pk}') for pk in tag_ids
+    ))
+    ingredient_ids = _reserve(Ingredient, ingredients)
+    write(Ingredient, ('id', 'name', 'measurement_unit'), (
+        (pk, f'{rng.choice(WORDS)} {pk}', rng.choice(UNITS))
+        for pk in ingredient_ids
+    ))
+
+    recipe_ids = _reserve(Recipe, recipes)
+    recipe_sampler = ZipfSampler(recipe_ids, exponent, rng)
+    author_sampler = ZipfSampler(user_ids, exponent, rng)
+    recipe_authors = [author_sampler.choice(rng) for _ in recipe_ids]
+
+    # Избранное и корзины генерируются дважды одним и тем же потоком
+    # случайных чисел: сначала ради счётчиков в строках рецептов,
+    # потом для записи самих связей.
+    def relations(name, mean):
+        stream = random.Random(f'{seed}:{name}')
+        for user_id in user_ids:
+            degree = _get_degree(stream, mean)
+            for recipe_id in recipe_sampler.sample(stream, degree):
+                yield user_id, recipe_id
+
+    counters = {}
+    for name, mean in (('favorites', favorites), ('carts', carts)):
+        counters[name] = [0] * len(recipe_ids)
+        for _, recipe_id in relations(name, mean):
+            counters[name][recipe_id - recipe_ids.start] += 1
+
+    write(Recipe, (
+        'id', 'author_id', 'short_link', 'name', 'text', 'cooking_time',
+        'pub_date', 'favorites_count', 'carts_count',
+    ), (
+        (
+            pk, recipe_authors[index], encode_short_link(pk),
+            ' '.join(rng.sample(WORDS, 3)).capitalize(),
+            ' '.join(rng.choices(WORDS, k=60)), rng.randint(1, 180),
+            now - timedelta(minutes=index),
+            counters['favorites'][index], counters['carts'][index],
+        )
+        for index, pk in enumerate(recipe_ids)
+    ))
+
+    ingredient_sampler = ZipfSampler(ingredient_ids, exponent, rng)
+    pks = count(_get_next_pk(IngredientRecipe))
+    write(IngredientRecipe, ('id', 'recipe_id', 'ingredient_id', 'amount'), (
+        (next(pks), recipe_id, ingredient_id, rng.randint(1, 500))
+        for recipe_id in recipe_ids
+        for ingredient_id in ingredient_sampler.sample(
+            rng, max(1, round(rng.gauss(
+                recipe_ingredients, recipe_ingredients / 3
+            )))
+        )
+    ))
+    tag_sampler = ZipfSampler(tag_ids, exponent, rng)
+    pks = count(_get_next_pk(Recipe.tags.through))
+    write(Recipe.tags.through, ('id', 'recipe_id', 'tag_id'), (
+        (next(pks), recipe_id, tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in tag_sampler.sample(rng, rng.randint(1, recipe_tags))
+    ))
+
+    # Подписки на популярных авторов чаще: входящие степени
+    # подчиняются закону Ципфа, исходящие — Парето.
+    def follow_pairs():
+        stream = random.Random(f'{seed}:follows')
+        for user_id in user_ids:
+            degree = _get_degree(stream, follows)
+            following_ids = [
+                following_id
+                for following_id in author_sampler.sample(stream, degree + 1)
+                if following_id != user_id
+            ]
+            for following_id in following_ids[:degree]:
+                yield user_id, following_id
+
+    # Ленты заполняются при подписке всеми рецептами автора.
+    # Дата хранится строкой, чтобы не форматировать её для каждой
+    # записи ленты заново.
+    recipes_by_author = defaultdict(list)
+    if feeds:
+        for index, author_id in enumerate(recipe_authors):
+            recipes_by_author[author_id].append((
+                recipe_ids[index], author_id,
+                str(now - timedelta(minutes=index)),
+            ))
+    pks = count(_get_next_pk(Follow))
+    write(Follow, ('id', 'user_id', 'following_id'), (
+        (next(pks), user_id, following_id)
+        for user_id, following_id in follow_pairs()
+    ))
+    for model, name, mean in (
+        (Favorite, 'favorites', favorites), (ShoppingCart, 'carts', carts),
+    ):
+        pks = count(_get_next_pk(model))
+        write(model, ('id', 'user_id', 'recipe_id'), (
+            (next(pks), user_id, recipe_id)
+            for user_id, recipe_id in relations(name, mean)
+        ))
+
+    if feeds:
+        pks = count(_get_next_pk(FeedItem))
+        fields = ('id', 'user_id', 'recipe_id', 'author_id', 'pub_date')
+        write(FeedItem, fields, (
+            (next(pks), user_id) + item
+            for user_id, following_id in follow_pairs()
+            for item in recipes_by_author.get(following_id, ())
+        ))
+
+    _reset_sequences(created)
+    ShoppingListItem.objects.rebuild(batch_size=batch_size)
+    for name in (
+        INGREDIENTS_VERSION, TAGS_VERSION, RECIPES_VERSION,
+        RECIPE_CHANGES_VERSION, SHOPPING_LIST_VERSION,
+    ):
+        bump_version(name)
+    return created
+
+
+def _get_next_pk(model):
+    return (model.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+
+def _reserve(model, size):
+    start = _get_next_pk(model)
+    return range(start, start + size)
+
+
+def _get_degree(rng, mean):
+    """Случайная степень из распределения Парето со средним около mean."""
+    scale = mean * (PARETO_ALPHA - 1) / PARETO_ALPHA
+    return int(scale * rng.paretovariate(PARETO_ALPHA))
+
+
+def _write(model, fields, rows, batch_size):
+    """Пишет кортежи значений fields в таблицу модели пачками."""
+    write_batch = (
+        _copy if connection.vendor == 'postgresql' else _bulk_create
+    )
+    fields = [model._meta.get_field(name) for name in fields]
+    written = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return written
+        write_batch(model, fields, batch)
+        written += len(batch)
+
+
+def _bulk_create(model, fields, batch):
+    names = [field.attname for field in fields]
+    model.objects.bulk_create(
+        model(**dict(zip(names, row))) for row in batch
+    )
+
+
+def _copy(model, fields, batch):
+    """COPY FROM STDIN в CSV; остальные поля заполняются умолчаниями."""
+    defaults = [
+        field for field in model._meta.concrete_fields
+        if field not in fields
+    ]
+    tail = tuple(
+        COPY_NULL if value is None else value
+        for value in (
+            field.get_db_prep_save(field.get_default(), connection)
+            for field in defaults
+        )
+    )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        tuple(COPY_NULL if value is None else value for value in row) + tail
+        for row in batch
+    )
+    buffer.seek(0)
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(field.column) for field in (*fields, *defaults)
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote_name(model._meta.db_table)} ({columns}) '
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer
+        )
+
+
+def _reset_sequences(models):
+    """Сдвигает последовательности PostgreSQL за выданные вручную pk."""
+    statements = connection.ops.sequence_reset_sql(no_style(), list(models))
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
@@ -0,0 +1,226 @@
+import base64
+import binascii
+import logging
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from django.db import connections, router, transaction
+from PIL import Image, ImageOps
+from rest_framework.exceptions import ValidationError
+
+from recipe.models import Recipe
+from .cache import recipe_representations
+from .constants import (BASE64_CHUNK_SIZE, BASE64_SEPARATOR,
+                        DATA_URL_HEADER_MAX_LENGTH, DATA_URL_PREFIX,
+                        IMAGE_FORMATS, IMAGE_QUALITY, IMAGE_RENDITIONS,
+                        IMAGE_RENDITIONS_DIR, IMAGE_SOURCE_KEY)
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """Пул потоков для рендишенов: Pillow отпускает GIL при resize и save."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    settings.IMAGE_WORKERS, thread_name_prefix='renditions'
+                )
+    return _executor
+
+
+def decode_data_url(data):
+    """Декодирует data URL изображения порциями в загруженный файл.
+
+    Размер результата известен по длине строки, поэтому слишком большие
+    файлы отклоняются до декодирования. Как и загрузчики Django, файл
+    больше FILE_UPLOAD_MAX_MEMORY_SIZE пишется во временный файл на
+    диске, а в памяти одновременно держится только одна порция.
+    Переносы строк и пробелы в base64 допускаются, как и в b64decode
+    без validate.
+    """
+    separator = data.find(BASE64_SEPARATOR, 0, DATA_URL_HEADER_MAX_LENGTH)
+    extension = data[len(DATA_URL_PREFIX):separator]
+    start = separator + len(BASE64_SEPARATOR)
+    if WHITESPACE_RE.search(data, start):
+        # Длина и границы порций считаются по строке без пробелов.
+        data = data[:start] + WHITESPACE_RE.sub('', data[start:])
+    encoded_size = len(data) - start
+    size = encoded_size // 4 * 3 - data.endswith('=') - data.endswith('==')
+    if (
+        separator == -1 or not extension.isalnum()
+        or encoded_size % 4 or size <= 0
+    ):
+        raise ValidationError('Загрузите корректное изображение.')
+    if size > settings.IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            f'Размер изображения больше '
+            f'{settings.IMAGE_MAX_UPLOAD_SIZE // (1024 * 1024)} МБ.'
+        )
+
+    name, content_type = f'temp.{extension}', f'image/{extension}'
+    if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        file = TemporaryUploadedFile(name, content_type, size, None)
+    else:
+        file = InMemoryUploadedFile(
+            BytesIO(), None, name, content_type, size, None
+        )
+    try:
+        for position in range(start, len(data), BASE64_CHUNK_SIZE):
+            file.write(base64.b64decode(
+                data[position:position + BASE64_CHUNK_SIZE], validate=True
+            ))
+    except binascii.Error:
+        file.close()
+        raise ValidationError('Загрузите корректное изображение.')
+    file.seek(0)
+    try:
+        check_dimensions(file)
+    except ValidationError:
+        file.close()
+        raise
+    return file
+
+
+def check_dimensions(file):
+    """Проверяет размеры по заголовку файла, не декодируя пиксели."""
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError('Загрузите корректное изображение.')
+    finally:
+        file.seek(0)
+    if (
+        max(width, height) > settings.IMAGE_MAX_DIMENSION
+        or width * height > settings.IMAGE_MAX_PIXELS
+    ):
+        raise ValidationError(
+            f'Изображение {width}x{height} слишком большое: не больше '
+            f'{settings.IMAGE_MAX_DIMENSION} пикселей по стороне и '
+            f'{settings.IMAGE_MAX_PIXELS // 10 ** 6} Мпикс всего.'
+        )
+
+
+def render(name):
+    """Сохраняет рендишены файла name из хранилища.
+
+    Возвращает {IMAGE_SOURCE_KEY: name, рендишен: {формат: имя файла}}.
+    """
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image.draft('RGB', IMAGE_RENDITIONS['full'])
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    renditions = {IMAGE_SOURCE_KEY: name}
+    for rendition, size in IMAGE_RENDITIONS.items():
+        image.thumbnail(size, Image.LANCZOS)
+        renditions[rendition] = {}
+        for image_format, extension in IMAGE_FORMATS.items():
+            path = os.path.join(
+                directory, IMAGE_RENDITIONS_DIR,
+                f'{stem}_{rendition}.{extension}'
+            )
+            buffer = BytesIO()
+            _convert(image, image_format).save(
+                buffer, image_format, quality=IMAGE_QUALITY
+            )
+            default_storage.delete(path)
+            renditions[rendition][image_format] = default_storage.save(
+                path, ContentFile(buffer.getvalue())
+            )
+    return renditions
+
+
+def _convert(image, image_format):
+    """JPEG не поддерживает прозрачность: подкладываем белый фон."""
+    if image_format != 'jpeg' or image.mode == 'RGB':
+        return image
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def schedule_renditions(instance, field_name):
+    """Запускает генерацию рендишенов после коммита, если они устарели.
+
+    Рендишены хранятся в поле <field_name>_renditions вместе с именем
+    исходного файла, поэтому сохранение без смены картинки ничего не
+    запускает.
+    """
+    name = getattr(instance, field_name).name
+    renditions_field = f'{field_name}_renditions'
+    if not name or (
+        getattr(instance, renditions_field).get(IMAGE_SOURCE_KEY) == name
+    ):
+        return
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(
+        lambda: submit_renditions(model, pk, field_name, name)
+    )
+
+
+def submit_renditions(model, pk, field_name, name):
+    """Генерация рендишенов в пуле; возвращает Future.
+
+    SQLite не допускает параллельных записей: UPDATE из потока пула
+    отнимает блокировку у запроса, который ещё пишет, и тот падает
+    с database is locked. Там рендишены создаются в текущем потоке.
+    """
+    if connections[router.db_for_write(model)].vendor == 'sqlite':
+        future = Future()
+        future.set_result(_generate(model, pk, field_name, name))
+        return future
+    return get_executor().submit(
+        _generate_in_worker, model, pk, field_name, name
+    )
+
+
+def generate_renditions(model, pk, field_name, name):
+    """Рендишены для объекта, если его картинка всё ещё name."""
+    renditions = render(name)
+    updated = model.objects.filter(pk=pk, **{field_name: name}).update(
+        **{f'{field_name}_renditions': renditions}
+    )
+    if updated:
+        # UPDATE не шлёт post_save, а рендишены картинки рецепта
+        # и аватара автора входят в кешированное представление рецепта.
+        recipes = Recipe.objects.filter(
+            **{'pk' if model is Recipe else 'author_id': pk}
+        )
+        recipe_representations.forget_on_commit(
+            recipes.values_list('pk', flat=True)
+        )
+    return updated
+
+
+def _generate(model, pk, field_name, name):
+    try:
+        return generate_renditions(model, pk, field_name, name)
+    except Exception:
+        logger.exception('Не удалось создать рендишены для %s', name)
+        return 0
+
+
+def _generate_in_worker(model, pk, field_name, name):
+    try:
+        return _generate(model, pk, field_name, name)
+    finally:
+        connections.close_all()
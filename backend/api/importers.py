@@ -0,0 +1,71 @@
+import csv
+import json
+
+from django.core.management.base import CommandError
+
+from .constants import IMPORT_MAX_RECORD_SIZE
+
+FORMATS = ('csv', 'json', 'jsonl')
+
+
+def read_csv(file, fields, header=True):
+    """Кортежи значений fields из CSV-файла; None вместо пропущенных."""
+    fieldnames = None if header else fields
+    for row in csv.DictReader(file, fieldnames=fieldnames):
+        yield tuple(row.get(field) for field in fields)
+
+
+def pick_fields(rows, fields):
+    """Кортежи значений fields из объектов JSON; None вместо пропущенных."""
+    for row in rows:
+        if not isinstance(row, dict):
+            row = {}
+        yield tuple(row.get(field) for field in fields)
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json_array(file, chunk_size=64 * 1024,
+                    max_record_size=IMPORT_MAX_RECORD_SIZE):
+    """Потоково читает JSON-массив, не загружая файл целиком.
+
+    Если элемент не разбирается и после max_record_size символов,
+    файл считается повреждённым: иначе в буфер ушёл бы весь его остаток.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if not chunk:
+                    raise CommandError('JSON-файл оборван.')
+                if len(buffer) - position > max_record_size:
+                    raise CommandError(
+                        f'Некорректный JSON или элемент массива длиннее '
+                        f'{max_record_size} символов: {error}'
+                    )
+                break
+            yield row
+        buffer = buffer[position:]
+        if not chunk:
+            return
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.cache import short_link_cache
+from recipe.models import Recipe, encode_short_link
+
+
+class Command(BaseCommand):
+    help = 'Выдача коротких ссылок рецептам без кода'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help=(
+                'Перевыпустить коды всем рецептам. Ранее выданные ссылки '
+                'перестанут работать!'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки обновления',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(
+                Q(short_link__isnull=True) | Q(short_link='')
+            )
+
+        batch_size = options['batch_size']
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)
+                .only('pk', 'short_link')[:batch_size]
+            )
+            if not batch:
+                break
+            # Старые коды перестают работать сразу, а для новых
+            # сбрасываются закешированные «не найдено».
+            codes = [
+                recipe.short_link for recipe in batch if recipe.short_link
+            ]
+            for recipe in batch:
+                recipe.short_link = encode_short_link(recipe.pk)
+                codes.append(recipe.short_link)
+            Recipe.objects.bulk_update(batch, ('short_link', ))
+            short_link_cache.forget_many(codes)
+            updated += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Короткие ссылки выданы рецептам: {updated}'
+        ))
@@ -0,0 +1,230 @@
+import json
+import platform
+import random
+import statistics
+import tracemalloc
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.fixtures import generate_dataset
+from api.metrics import RequestMetrics
+from recipe.models import Ingredient, Recipe, ShoppingCart
+
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench_api',
+    }
+}
+
+# Метрики, рост которых при сравнении прогонов считается регрессией.
+COMPARED = ('p50_ms', 'p95_ms', 'queries', 'alloc_kb')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк горячих путей API на синтетических данных '
+        'во временной тестовой БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--follows', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=20)
+        parser.add_argument('--carts', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Количество замеров на каждый сценарий',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Количество прогревочных запросов на каждый сценарий',
+        )
+        parser.add_argument(
+            '--output', help='Куда сохранить результаты в JSON',
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON предыдущего прогона для поиска регрессий',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый относительный рост метрик при сравнении',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            with override_settings(CACHES=BENCH_CACHES):
+                report = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<24} p50 {result["p50_ms"]:7.2f} мс  '
+                f'p95 {result["p95_ms"]:7.2f} мс  '
+                f'запросов {result["queries"]:3}  '
+                f'память {result["alloc_kb"]:8.1f} КБ'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+        if baseline is not None:
+            self._compare(baseline, report, options['threshold'])
+
+    def _run(self, options):
+        started = perf_counter()
+        dataset = generate_dataset(
+            users=options['users'], recipes=options['recipes'],
+            ingredients=options['ingredients'], follows=options['follows'],
+            favorites=options['favorites'], carts=options['carts'],
+            seed=options['seed'],
+        )
+        self.stdout.write(
+            f'Данные сгенерированы за {perf_counter() - started:.1f} с'
+        )
+
+        viewer_id = (
+            ShoppingCart.objects.filter(user__follower__isnull=False)
+            .values_list('user_id', flat=True)
+            .order_by('user_id')
+            .first()
+        )
+        if viewer_id is None:
+            raise CommandError('Нет пользователя с корзиной и подписками.')
+        client = Client(HTTP_AUTHORIZATION='Token ' + Token.objects.create(
+            user_id=viewer_id
+        ).key)
+
+        rng = random.Random(options['seed'])
+        recipes = list(Recipe.objects.values_list('pk', 'short_link'))
+        ingredients = list(Ingredient.objects.values_list('name', flat=True))
+        scenarios = {
+            'recipe-list': lambda: '/api/recipes/',
+            'recipe-detail': lambda: (
+                f'/api/recipes/{rng.choice(recipes)[0]}/'
+            ),
+            'subscriptions': lambda: '/api/users/subscriptions/',
+            'ingredient-autocomplete': lambda: (
+                f'/api/ingredients/?name={rng.choice(ingredients)[:3]}'
+            ),
+            'download-shopping-cart': lambda: (
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'short-link-redirect': lambda: f'/s/{rng.choice(recipes)[1]}/',
+        }
+        results = {
+            name: self._measure(client, get_url, options)
+            for name, get_url in scenarios.items()
+        }
+        return {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                model._meta.label: count for model, count in dataset.items()
+            },
+            'options': {
+                key: options[key] for key in (
+                    'users', 'recipes', 'ingredients', 'follows',
+                    'favorites', 'carts', 'seed', 'repeat', 'warmup',
+                )
+            },
+            'results': results,
+        }
+
+    def _measure(self, client, get_url, options):
+        """Задержки, число SQL-запросов и пик памяти на запрос.
+
+        Память меряется отдельным проходом: tracemalloc замедляет
+        выполнение и исказил бы задержки.
+        """
+        for _ in range(options['warmup']):
+            self._request(client, get_url())
+
+        timings, queries = [], []
+        for _ in range(options['repeat']):
+            metrics = RequestMetrics()
+            with connection.execute_wrapper(metrics.execute):
+                started = perf_counter()
+                self._request(client, get_url())
+                timings.append(perf_counter() - started)
+            queries.append(metrics.queries)
+
+        allocations = []
+        tracemalloc.start()
+        try:
+            for _ in range(max(1, options['repeat'] // 5)):
+                url = get_url()
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                self._request(client, url)
+                peak = tracemalloc.get_traced_memory()[1]
+                allocations.append(peak - baseline)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(timings, 0.5) * 1e3, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1e3, 3),
+            'mean_ms': round(statistics.mean(timings) * 1e3, 3),
+            'queries': max(queries),
+            'queries_mean': round(statistics.mean(queries), 2),
+            'alloc_kb': round(statistics.median(allocations) / 1024, 1),
+        }
+
+    @staticmethod
+    def _request(client, url):
+        response = client.get(url)
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return response
+
+    def _compare(self, baseline, report, threshold):
+        if baseline['options'] != report['options']:
+            self.stdout.write(self.style.WARNING(
+                'Параметры прогонов различаются, сравнение неточно'
+            ))
+        regressions = []
+        for name, result in report['results'].items():
+            previous = baseline['results'].get(name)
+            if previous is None:
+                continue
+            for metric in COMPARED:
+                old, new = previous[metric], result[metric]
+                if new > old * (1 + threshold):
+                    regressions.append(f'{name}.{metric}: {old} -> {new}')
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно ' + baseline['created_at'] + ':\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено'))
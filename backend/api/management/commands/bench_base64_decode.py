@@ -0,0 +1,63 @@
+import base64
+import os
+import tracemalloc
+from io import BytesIO
+from timeit import timeit
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from api.images import decode_data_url
+
+
+def split_decode(data):
+    header, encoded = data.split(';base64,')
+    extension = header.split('/')[-1]
+    return ContentFile(base64.b64decode(encoded), name='temp.' + extension)
+
+
+class Command(BaseCommand):
+    help = 'Память и время декодирования base64-картинок: целиком и порциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', type=int, default=1500,
+            help='Сторона тестового PNG с шумом в пикселях',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Количество повторов на каждый вариант',
+        )
+
+    def handle(self, *args, **options):
+        size = options['size']
+        buffer = BytesIO()
+        Image.frombytes(
+            'RGB', (size, size), os.urandom(size * size * 3)
+        ).save(buffer, 'PNG')
+        data = (
+            'data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode()
+        )
+        self.stdout.write(
+            f'PNG {len(buffer.getvalue()) / 2 ** 20:.1f} МБ, '
+            f'data URL {len(data) / 2 ** 20:.1f} МБ'
+        )
+        del buffer
+
+        for title, decode in (
+            ('split + b64decode', split_decode),
+            ('порциями', decode_data_url),
+        ):
+            tracemalloc.start()
+            decode(data).close()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            elapsed = timeit(
+                lambda: decode(data).close(), number=options['repeat']
+            ) / options['repeat']
+            self.stdout.write(
+                f'{title}: пик памяти {peak / 2 ** 20:.2f} МБ, '
+                f'{elapsed * 1e3:.0f} мс'
+            )
@@ -0,0 +1,86 @@
+import json
+from timeit import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import (IngredientSerializer, RecipeShortSerializer,
+                             TagSerializer, compiled_ingredients,
+                             compiled_short_recipes, compiled_tags)
+from recipe.models import Ingredient, Recipe, Tag
+
+
+def dump(data):
+    """JSON с порядком ключей: OrderedDict и dict сравниваются побайтно."""
+    return json.dumps(data, ensure_ascii=False)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка и скорость сериализации справочников и кратких рецептов: '
+        'ModelSerializer и CompiledSerializer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=2000,
+            help='Максимум объектов каждой модели',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Количество повторов на каждый вариант',
+        )
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/'))
+        limit, repeat = options['limit'], options['repeat']
+        for title, serializer_class, compiled, queryset in (
+            ('теги', TagSerializer, compiled_tags, Tag.objects.all()),
+            (
+                'ингредиенты', IngredientSerializer, compiled_ingredients,
+                Ingredient.objects.all(),
+            ),
+            (
+                'краткие рецепты', RecipeShortSerializer,
+                compiled_short_recipes, Recipe.objects.order_by('pk'),
+            ),
+        ):
+            queryset = queryset[:limit]
+            instances = list(queryset)
+            rows = list(queryset.values(*compiled.values))
+            for context_request in (request, None):
+                expected = dump(serializer_class(
+                    instances, many=True,
+                    context={'request': context_request},
+                ).data)
+                for variant, actual in (
+                    ('строки', compiled.serialize(rows, context_request)),
+                    ('объекты', [
+                        compiled.serialize_instance(instance, context_request)
+                        for instance in instances
+                    ]),
+                ):
+                    if dump(actual) != expected:
+                        raise CommandError(
+                            f'{title}: {variant} расходятся с '
+                            f'{serializer_class.__name__}.'
+                        )
+
+            model = timeit(
+                lambda: serializer_class(
+                    list(queryset), many=True, context={'request': request}
+                ).data,
+                number=repeat,
+            ) / repeat
+            fast = timeit(
+                lambda: compiled.serialize(
+                    queryset.values(*compiled.values), request
+                ),
+                number=repeat,
+            ) / repeat
+            self.stdout.write(
+                f'{title} ({len(rows)}): вывод совпадает, '
+                f'ModelSerializer {model * 1e3:.2f} мс, '
+                f'compiled {fast * 1e3:.2f} мс, x{model / fast:.1f}'
+            )
@@ -0,0 +1,70 @@
+import random
+from timeit import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+
+from api.search import cookable_index
+from recipe.models import Ingredient, IngredientRecipe
+
+
+def orm_cookable(ingredient_ids, limit):
+    return list(
+        IngredientRecipe.objects.values('recipe')
+        .annotate(
+            total=Count('id'),
+            hits=Count('id', filter=Q(ingredient_id__in=ingredient_ids)),
+        )
+        .filter(hits__gt=0)
+        .annotate(
+            coverage=Cast('hits', FloatField()) / F('total'),
+            missing=F('total') - F('hits'),
+        )
+        .order_by('-coverage', 'missing', '-recipe_id')[:limit]
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сравнение «что приготовить»: GROUP BY в БД и индекс в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Количество повторов на каждый вариант',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=10,
+            help='Количество имеющихся ингредиентов в запросе',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=10,
+            help='Размер топа рецептов',
+        )
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(
+            IngredientRecipe.objects.values_list(
+                'ingredient_id', flat=True
+            ).distinct()
+        ) or list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError('В БД нет ингредиентов.')
+
+        query = random.sample(
+            ingredient_ids, min(options['ingredients'], len(ingredient_ids))
+        )
+        limit, repeat = options['limit'], options['repeat']
+        build = timeit(
+            lambda: cookable_index.search(query, limit), number=1
+        )
+        self.stdout.write(f'построение индекса: {build * 1e3:.0f} мс')
+
+        orm = timeit(lambda: orm_cookable(query, limit), number=repeat)
+        index = timeit(
+            lambda: cookable_index.search(query, limit), number=repeat
+        )
+        self.stdout.write(
+            f'ORM {orm / repeat * 1e3:.1f} мс, '
+            f'индекс {index / repeat * 1e3:.1f} мс, x{orm / index:.0f}'
+        )
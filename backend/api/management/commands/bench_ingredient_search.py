@@ -0,0 +1,42 @@
+from timeit import timeit
+
+from django.core.management.base import BaseCommand
+
+from api.search import ingredient_index
+from api.serializers import IngredientSerializer
+from recipe.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Сравнение автодополнения ингредиентов: ORM и индекс в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Количество повторов на каждый запрос',
+        )
+        parser.add_argument(
+            'queries', nargs='*', default=['а', 'мо', 'сол', 'сыр', 'ябл'],
+            help='Строки поиска',
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        ingredient_index.search()
+
+        for query in options['queries']:
+            orm = timeit(
+                lambda: IngredientSerializer(
+                    Ingredient.objects.filter(name__istartswith=query),
+                    many=True
+                ).data,
+                number=repeat
+            )
+            index = timeit(
+                lambda: ingredient_index.search(query), number=repeat
+            )
+            self.stdout.write(
+                f'{query!r}: ORM {orm / repeat * 1e6:.0f} мкс, '
+                f'индекс {index / repeat * 1e6:.0f} мкс, '
+                f'x{orm / index:.0f}'
+            )
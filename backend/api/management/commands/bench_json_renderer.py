@@ -0,0 +1,86 @@
+from io import BytesIO
+from timeit import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeReadSerializer
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Скорость JSON-рендеринга и разбора страницы рецептов: '
+        'stdlib json и orjson'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size', type=int, default=100,
+            help='Количество рецептов на странице',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Количество повторов на каждый вариант',
+        )
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson не установлен.')
+        recipes = list(
+            Recipe.objects.with_viewer_flags(None).with_related(None)
+            [:options['page_size']]
+        )
+        if not recipes:
+            raise CommandError('В БД нет рецептов.')
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        data = {
+            'count': len(recipes),
+            'next': None,
+            'previous': None,
+            'results': RecipeReadSerializer(
+                recipes, many=True, context={'request': request}
+            ).data,
+        }
+
+        renderers = (JSONRenderer(), FastJSONRenderer())
+        rendered = [renderer.render(data) for renderer in renderers]
+        if rendered[0] != rendered[1]:
+            raise CommandError('Вывод рендереров различается.')
+        parsed = [
+            parser.parse(BytesIO(rendered[0]))
+            for parser in (JSONParser(), FastJSONParser())
+        ]
+        if parsed[0] != parsed[1]:
+            raise CommandError('Результаты разбора различаются.')
+        size = len(rendered[0])
+        self.stdout.write(
+            f'{len(recipes)} рецептов, {size / 1024:.1f} КБ, вывод совпадает'
+        )
+
+        repeat = options['repeat']
+        for action, (slow, fast) in (
+            ('рендеринг', [
+                lambda renderer=renderer: renderer.render(data)
+                for renderer in renderers
+            ]),
+            ('разбор', [
+                lambda parser=parser: parser.parse(BytesIO(rendered[0]))
+                for parser in (JSONParser(), FastJSONParser())
+            ]),
+        ):
+            slow, fast = (
+                timeit(function, number=repeat) / repeat
+                for function in (slow, fast)
+            )
+            self.stdout.write(
+                f'{action}: json {slow * 1e3:.2f} мс '
+                f'({size / slow / 2 ** 20:.0f} МБ/с), '
+                f'orjson {fast * 1e3:.2f} мс '
+                f'({size / fast / 2 ** 20:.0f} МБ/с), x{slow / fast:.1f}'
+            )
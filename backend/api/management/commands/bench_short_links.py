@@ -0,0 +1,65 @@
+import random
+from timeit import timeit
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.test import RequestFactory
+
+from api.cache import short_link_cache
+from api.constants import SHORT_LINK_CACHE_KEY
+from api.views import short_link_view_redirect
+from recipe.models import Recipe
+
+
+def uncached_redirect(request, short_code):
+    recipe = get_object_or_404(Recipe, short_link=short_code)
+    return HttpResponseRedirect(
+        request.build_absolute_uri(f'/recipes/{recipe.id}/')
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пропускная способность редиректа /s/<code>/ с кешем и без'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=5000,
+            help='Количество запросов на каждый вариант',
+        )
+        parser.add_argument(
+            '--codes', type=int, default=100,
+            help='Количество разных коротких ссылок в выборке',
+        )
+
+    def handle(self, *args, **options):
+        codes = list(
+            Recipe.objects.values_list('short_link', flat=True)
+            [:options['codes']]
+        )
+        if not codes:
+            raise CommandError('В БД нет рецептов.')
+
+        total = options['requests']
+        factory = RequestFactory()
+        requests = [
+            (factory.get(f'/s/{code}/'), code)
+            for code in random.choices(codes, k=total)
+        ]
+        for code in codes:
+            short_link_cache.local.delete(code)
+            cache.delete(SHORT_LINK_CACHE_KEY.format(code))
+
+        for title, view in (
+            ('без кеша', uncached_redirect),
+            ('с кешем', short_link_view_redirect),
+        ):
+            elapsed = timeit(
+                lambda: [view(request, code) for request, code in requests],
+                number=1
+            )
+            self.stdout.write(
+                f'{title}: {total / elapsed:.0f} запросов/с, '
+                f'{elapsed / total * 1e6:.0f} мкс на запрос'
+            )
@@ -0,0 +1,57 @@
+from timeit import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from recipe.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = 'Планы и время фильтра рецептов по тегам: JOIN и EXISTS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tags', nargs='*',
+            help='Слаги тегов; по умолчанию первые три',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Количество повторов на каждый вариант',
+        )
+        parser.add_argument(
+            '--page-size', type=int, default=6,
+            help='Размер страницы рецептов',
+        )
+
+    def handle(self, *args, **options):
+        slugs = options['tags'] or list(
+            Tag.objects.values_list('slug', flat=True)[:3]
+        )
+        if not slugs:
+            raise CommandError('В БД нет тегов.')
+
+        page_size = options['page_size']
+        factory = RequestFactory()
+        variants = {
+            'JOIN + DISTINCT': Recipe.objects.filter(
+                tags__slug__in=slugs
+            ).distinct(),
+        }
+        for mode in ('any', 'all'):
+            request = factory.get('/', {'tags': slugs, 'tags_mode': mode})
+            variants[f'EXISTS, tags_mode={mode}'] = RecipeFilter(
+                request.GET, queryset=Recipe.objects.all(), request=request
+            ).qs
+
+        repeat = options['repeat']
+        for title, queryset in variants.items():
+            page = queryset.order_by('-pub_date', '-id')[:page_size]
+            count = timeit(queryset.count, number=repeat) / repeat
+            fetch = timeit(lambda: list(page), number=repeat) / repeat
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{title}: {queryset.count()} рецептов, '
+                f'COUNT {count * 1e3:.1f} мс, '
+                f'страница {fetch * 1e3:.1f} мс'
+            ))
+            self.stdout.write(page.explain())
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
 
+from api.cache import bump_version
+from api.constants import INGREDIENTS_VERSION
 from recipe.models import Ingredient
 
 
@@ -11,6 +13,8 @@ class Command(BaseCommand):
 
         ingredients_after = Ingredient.objects.all()
 
+        bump_version(INGREDIENTS_VERSION)
+
         if len(ingredients) != len(ingredients_after):
             self.stdout.write(self.style.SUCCESS('Данные успешно удалены'))
         else:
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.fixtures import FIXTURE_PASSWORD, ZIPF_EXPONENT, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация синтетических пользователей, рецептов, подписок, '
+        'избранного и корзин для нагрузочного тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Среднее число подписок у пользователя',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в корзине у пользователя',
+        )
+        parser.add_argument(
+            '--recipe-ingredients', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте',
+        )
+        parser.add_argument(
+            '--recipe-tags', type=int, default=2,
+            help='Максимальное число тегов у рецепта',
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=ZIPF_EXPONENT,
+            help='Показатель закона Ципфа для популярности',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Количество строк в одной пачке COPY / bulk_create',
+        )
+        parser.add_argument(
+            '--no-feeds', action='store_true',
+            help='Не заполнять ленты подписок',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            created = generate_dataset(
+                users=options['users'],
+                recipes=options['recipes'],
+                ingredients=options['ingredients'],
+                tags=options['tags'],
+                follows=options['follows'],
+                favorites=options['favorites'],
+                carts=options['carts'],
+                recipe_ingredients=options['recipe_ingredients'],
+                recipe_tags=options['recipe_tags'],
+                seed=options['seed'],
+                exponent=options['zipf'],
+                batch_size=options['batch_size'],
+                feeds=not options['no_feeds'],
+            )
+        elapsed = time.monotonic() - started
+
+        for model, count in created.items():
+            self.stdout.write(f'{model._meta.label}: {count}')
+        rows = sum(created.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано строк: {rows} за {elapsed:.1f} с '
+            f'({rows / max(elapsed, 1e-9):.0f} строк/с, {connection.vendor}). '
+            f'Пароль пользователей: {FIXTURE_PASSWORD}'
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.constants import IMAGE_SOURCE_KEY
+from api.images import submit_renditions
+from recipe.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий изображений рецептов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать рендишены и для актуальных изображений',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        futures = [
+            submit_renditions(model, pk, field_name, name)
+            for model, field_name in ((Recipe, 'image'), (User, 'avatar'))
+            for pk, name, renditions in model.objects.exclude(
+                **{f'{field_name}__isnull': True}
+            ).exclude(**{field_name: ''}).values_list(
+                'pk', field_name, f'{field_name}_renditions'
+            ).order_by()
+            if options['all'] or renditions.get(IMAGE_SOURCE_KEY) != name
+        ]
+        done = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рендишены созданы: {done} из {len(futures)}, '
+            f'{time.monotonic() - started:.1f} с'
+        ))
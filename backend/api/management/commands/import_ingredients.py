@@ -1,31 +1,108 @@
-import json
 import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_version
+from api.constants import INGREDIENTS_VERSION
+from api.importers import (FORMATS, iter_json_array, pick_fields, read_csv,
+                           read_jsonl)
 from recipe.models import Ingredient
 
 
 class Command(BaseCommand):
-    help = 'Импорт данных по ингридиентов из JSON файла в БД'
+    help = 'Импорт ингредиентов из CSV, JSON или JSONL файла в БД'
 
-    def handle(self, *args, **kwargs):
-        data_dir = os.path.join(settings.BASE_DIR, 'data')
+    default_file = 'ingredients.json'
 
-        file_data = self.__get_data_from_file(data_dir, 'ingredients.json')
-        for el in file_data:
-            Ingredient.objects.update_or_create(
-                name=el['name'],
-                measurement_unit=el['measurement_unit']
-            )
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', self.default_file),
+            help='Путь к файлу с ингредиентами',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла; по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество строк в одном INSERT',
+        )
+        parser.add_argument(
+            '--no-header', action='store_true',
+            help='CSV без строки заголовка: name,measurement_unit',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        )
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+
+        started = time.monotonic()
+        fields = ('name', 'measurement_unit')
+        with open(path, encoding='utf-8', newline='') as file:
+            if file_format == 'csv':
+                rows = read_csv(
+                    file, fields, header=not options['no_header']
+                )
+            elif file_format == 'jsonl':
+                rows = pick_fields(read_jsonl(file), fields)
+            else:
+                rows = pick_fields(iter_json_array(file), fields)
+
+            with transaction.atomic():
+                read, created = self._import(rows, options['batch_size'])
 
-        self.stdout.write(self.style.SUCCESS('Данные успешно импортированы'))
+        bump_version(INGREDIENTS_VERSION)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные успешно импортированы: прочитано {read}, '
+            f'новых {created}, {read / max(elapsed, 1e-9):.0f} строк/с'
+        ))
+
+    def _import(self, rows, batch_size):
+        """Вставляет уникальные пары (name, measurement_unit) пачками.
+
+        Дубликаты внутри файла отбрасываются в памяти, а совпадения с
+        уже существующими строками — ограничением уникальности в БД.
+        """
+        self.read = 0
+        before = Ingredient.objects.count()
+        unique_rows = self._unique(rows)
+        while True:
+            batch = list(islice(unique_rows, batch_size))
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in batch
+                ),
+                ignore_conflicts=True,
+            )
+            if self.verbosity > 1:
+                self.stdout.write(f'  прочитано {self.read} строк')
+        return self.read, Ingredient.objects.count() - before
 
-    def __get_data_from_file(self, data_dir, file_name):
-        with open(
-            file=os.path.join(data_dir, file_name),
-            encoding='utf-8'
-        ) as file:
-            data = json.load(file)
-        return data
+    def _unique(self, rows):
+        seen = set()
+        for name, unit in rows:
+            self.read += 1
+            if not isinstance(name, str) or not isinstance(unit, str):
+                self.stdout.write(self.style.WARNING(
+                    f'Запись {self.read} пропущена: нужны строки name '
+                    'и measurement_unit'
+                ))
+                continue
+            key = (name.strip(), unit.strip())
+            if key[0] and key not in seen:
+                seen.add(key)
+                yield key
@@ -1,91 +1,238 @@
-import json
+import os
 import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
-from django.db import transaction
-
-from recipe.models import Ingredient, Recipe, IngredientRecipe, Tag
-
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from api.cache import bump_version
+from api.constants import (AMOUNT_MIN_VALUE, COOKING_TIME_MIN_VALUE,
+                           INT_FIELD_MAX_VALUE, RECIPE_CHANGES_VERSION,
+                           RECIPES_VERSION)
+from api.feeds import submit_fan_out
+from api.images import decode_data_url, schedule_renditions
+from api.importers import iter_json_array
+from recipe.models import (Ingredient, IngredientRecipe, Recipe, Tag,
+                           encode_short_link)
 
 User = get_user_model()
 
+RECIPE_FIELDS = ('name', 'text', 'cooking_time')
 
-class Command(BaseCommand):
-    fake_image = ''
-    author = None
-    users = User.objects.all()
 
-    def get_author(self):
-        return random.choice(self.users)
+def decode_image(data):
+    """((расширение, байты) или None, ошибка или None) из data URL.
 
-    def handle(self, *args, **options):
-        file_path = settings.BASE_DIR / 'data/recipes.json'
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    Картинка проверяется так же, как при загрузке через API. Ошибка
+    возвращается строкой: ValidationError не переживает передачу
+    из процесса пула.
+    """
+    if not data:
+        return None, None
+    try:
+        file = decode_data_url(data)
+    except ValidationError as error:
+        return None, ' '.join(map(str, error.detail))
+    with file:
+        return (os.path.splitext(file.name)[1].lstrip('.'), file.read()), None
 
-        try:
-            for recipe_data in data:
-                self._create_recipe(recipe_data)
-
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(str(e)))
 
-    def _create_recipe(self, recipe_data):
-        if not self.users.exists():
-            self.users = User.objects.all()
+def in_range(value, min_value, max_value=INT_FIELD_MAX_VALUE):
+    """Целое в пределах валидаторов модели, как требует API."""
+    return (
+        isinstance(value, int) and not isinstance(value, bool)
+        and min_value <= value <= max_value
+    )
 
-        tags = recipe_data.pop('tags')
-        ingredients = recipe_data.pop('ingredients')
-        recipe_name = recipe_data['name']
 
-        if Recipe.objects.filter(name=recipe_name).exists():
-            self.stdout.write(
-                self.style.WARNING(
-                    f'Рецепт {recipe_name!r} уже существует! Пропускаем.'
-                )
-            )
-            return
+class Command(BaseCommand):
+    help = 'Импорт рецептов из JSON файла в БД пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', 'recipes.json'),
+            help='Путь к JSON-массиву рецептов',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Количество рецептов в одной пачке',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Количество процессов для декодирования картинок',
+        )
 
+    def handle(self, *args, **options):
+        self.user_ids = list(User.objects.values_list('id', flat=True))
+        if not self.user_ids:
+            raise CommandError('Нет пользователей для авторства рецептов.')
+        self.ingredient_ids = set(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        self.tag_ids = set(Tag.objects.values_list('id', flat=True))
+
+        workers = options['workers']
+        executor = ProcessPoolExecutor(workers) if workers > 1 else None
+        started = time.monotonic()
+        created = 0
         try:
-            with transaction.atomic():
-                recipe, created = Recipe.objects.update_or_create(
-                    author=self.get_author(),
-                    defaults=recipe_data
+            with open(options['path'], encoding='utf-8') as file:
+                recipes = iter_json_array(file)
+                while True:
+                    chunk = list(islice(recipes, options['chunk_size']))
+                    if not chunk:
+                        break
+                    created += self._import_chunk(chunk, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        bump_version(RECIPES_VERSION)
+        bump_version(RECIPE_CHANGES_VERSION)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано рецептов: {created}, '
+            f'{created / max(elapsed, 1e-9):.0f} рецептов/с'
+        ))
+
+    def _import_chunk(self, chunk, executor):
+        existing = set(
+            Recipe.objects.filter(
+                name__in=[data.get('name') for data in chunk]
+            ).values_list('name', flat=True)
+        )
+        valid = []
+        for data in chunk:
+            error = self._validate(data, existing)
+            if error:
+                self.stdout.write(self.style.WARNING(
+                    f'Рецепт {data.get("name")!r} пропущен: {error}'
+                ))
+                continue
+            existing.add(data['name'])
+            valid.append(data)
+        if not valid:
+            return 0
+
+        images = [data.get('image') for data in valid]
+        if executor is not None:
+            images = executor.map(decode_image, images)
+        else:
+            images = map(decode_image, images)
+
+        recipes, records = [], []
+        try:
+            for data, (image, error) in zip(valid, images):
+                if error:
+                    self.stdout.write(self.style.WARNING(
+                        f'Рецепт {data["name"]!r} пропущен: {error}'
+                    ))
+                    continue
+                recipe = Recipe(
+                    author_id=random.choice(self.user_ids),
+                    **{field: data[field] for field in RECIPE_FIELDS
+                       if field in data}
                 )
-
-                tag_objects = Tag.objects.filter(id__in=tags)
-                recipe.tags.set(tag_objects)
-
-                for ingredient in ingredients:
-
-                    ingredient_id = ingredient['id']
-                    if not Ingredient.objects.filter(
-                        id=ingredient_id
-                    ).exists():
-                        raise ValueError(
-                            f'Ингредиент с ID {ingredient_id} не существует!'
-                        )
-
-                    current_ingredient = Ingredient.objects.get(
-                        id=ingredient_id
-                    )
-                    IngredientRecipe.objects.create(
-                        recipe=recipe,
-                        ingredient=current_ingredient,
-                        amount=ingredient['amount'],
+                if image is not None:
+                    ext, content = image
+                    recipe.image.save(
+                        f'{uuid.uuid4().hex}.{ext}', ContentFile(content),
+                        save=False
                     )
+                recipes.append(recipe)
+                records.append(data)
+            if not recipes:
+                return 0
 
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Успешно создан рецепт {recipe_name!r}!'
+            with transaction.atomic():
+                self._insert_recipes(recipes)
+                IngredientRecipe.objects.bulk_create(
+                    IngredientRecipe(
+                        recipe_id=recipe.pk,
+                        ingredient_id=ingredient['id'],
+                        amount=ingredient['amount'],
                     )
+                    for recipe, data in zip(recipes, records)
+                    for ingredient in data['ingredients']
                 )
-
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(
-                    f'Ошибка при создании рецепта {recipe_name}: {str(e)}'
+                Recipe.tags.through.objects.bulk_create(
+                    Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                    for recipe, data in zip(recipes, records)
+                    for tag_id in set(data['tags'])
                 )
+        except Exception:
+            # Картинки записываются до транзакции: после ошибки на них
+            # не ссылается ни один рецепт.
+            for recipe in recipes:
+                if recipe.image:
+                    recipe.image.storage.delete(recipe.image.name)
+            raise
+        return len(recipes)
+
+    @staticmethod
+    def _insert_recipes(recipes):
+        """Вставляет рецепты, выдаёт им короткие ссылки и рассылает в ленты.
+
+        Если БД не возвращает pk из bulk INSERT (SQLite в Django 3.2),
+        рецепты сохраняются по одному, остальные таблицы всё равно
+        заполняются пачкой. bulk_create не шлёт post_save, поэтому
+        рассылка и рендишены картинок планируются здесь же.
+        """
+        if not connection.features.can_return_rows_from_bulk_insert:
+            for recipe in recipes:
+                recipe.save()
+            return
+
+        Recipe.objects.bulk_create(recipes)
+        for recipe in recipes:
+            recipe.short_link = encode_short_link(recipe.pk)
+        Recipe.objects.bulk_update(recipes, ('short_link', ))
+        for recipe in recipes:
+            transaction.on_commit(
+                lambda recipe=recipe: submit_fan_out(recipe)
+            )
+            schedule_renditions(recipe, 'image')
+
+    def _validate(self, data, existing):
+        name = data.get('name')
+        if not name:
+            return 'нет названия'
+        if name in existing:
+            return 'рецепт уже существует'
+        if not in_range(data.get('cooking_time'), COOKING_TIME_MIN_VALUE):
+            return (
+                'время приготовления должно быть целым от '
+                f'{COOKING_TIME_MIN_VALUE} до {INT_FIELD_MAX_VALUE}'
+            )
+        ingredients = data.get('ingredients')
+        if not ingredients:
+            return 'нет ингредиентов'
+        if not all(
+            in_range(ingredient.get('amount'), AMOUNT_MIN_VALUE)
+            for ingredient in ingredients
+        ):
+            return (
+                'количество ингредиента должно быть целым от '
+                f'{AMOUNT_MIN_VALUE} до {INT_FIELD_MAX_VALUE}'
             )
+        ingredient_ids = [ingredient.get('id') for ingredient in ingredients]
+        missing = set(ingredient_ids) - self.ingredient_ids
+        if missing:
+            return f'ингредиенты {sorted(missing)} не существуют'
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            return 'ингредиенты повторяются'
+        tags = data.get('tags')
+        if not tags:
+            return 'нет тегов'
+        missing = set(tags) - self.tag_ids
+        if missing:
+            return f'теги {sorted(missing)} не существуют'
+        return None
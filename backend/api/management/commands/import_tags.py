@@ -4,6 +4,8 @@ import os
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from api.cache import bump_version
+from api.constants import TAGS_VERSION
 from recipe.models import Tag
 
 
@@ -20,6 +22,7 @@ class Command(BaseCommand):
                 slug=el['slug']
             )
 
+        bump_version(TAGS_VERSION)
         self.stdout.write(self.style.SUCCESS('Данные успешно импортированы'))
 
     def __get_data_from_file(self, data_dir, file_name):
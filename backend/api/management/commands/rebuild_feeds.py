@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipe.models import FeedItem
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок по подпискам и рецептам'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            FeedItem.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {FeedItem.objects.count()}'
+        ))
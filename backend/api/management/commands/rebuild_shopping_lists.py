@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipe.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересборка агрегата списков покупок и проверка расхождений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя таблицу',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки при вставке',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = self._get_drift()
+            if drift:
+                self.stdout.write(self.style.ERROR(
+                    f'Найдено расхождений: {len(drift)}'
+                ))
+                for key in sorted(drift)[:20]:
+                    self.stdout.write(f'  {key}: {drift[key]}')
+            else:
+                self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+
+        with transaction.atomic():
+            created = ShoppingListItem.objects.rebuild(
+                batch_size=options['batch_size']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Агрегат пересобран, позиций: {created}'
+        ))
+
+    @staticmethod
+    def _get_drift():
+        """Словарь (user, ingredient) -> (в таблице, ожидается)."""
+        actual = {
+            (row[0], row[1]): row[2:]
+            for row in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+            ).order_by().iterator()
+        }
+        expected = {
+            (row['recipe__shopping_recipe__user'], row['ingredient']): (
+                row['total_amount'], row['recipe_count']
+            )
+            for row in ShoppingListItem.objects.get_expected().iterator()
+        }
+        return {
+            key: (actual.get(key), expected.get(key))
+            for key in actual.keys() | expected.keys()
+            if actual.get(key) != expected.get(key)
+        }
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка favorites_count и carts_count рецептов '
+        'с таблицами избранного и корзины'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только показать рецепты с расхождениями',
+        )
+
+    def handle(self, *args, **options):
+        stale = Recipe.objects.out_of_sync()
+        if options['check']:
+            for recipe in stale.only('name', 'favorites_count', 'carts_count'):
+                self.stdout.write(
+                    f'{recipe.name}: избранное '
+                    f'{recipe.favorites_count} -> '
+                    f'{recipe.expected_favorites_count}, корзины '
+                    f'{recipe.carts_count} -> {recipe.expected_carts_count}'
+                )
+            return
+
+        updated = Recipe.objects.filter(
+            pk__in=list(stale.values_list('pk', flat=True))
+        ).refresh_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны у рецептов: {updated}'
+        ))
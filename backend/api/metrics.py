@@ -0,0 +1,182 @@
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import serializers
+
+from .constants import (METRICS_KEY, METRICS_PREFIX, METRICS_VIEW_KEY,
+                        METRICS_VIEWS_COUNT_KEY, METRICS_VIEWS_KEY)
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar('request_metrics', default=None)
+
+QUERY_SHAPE_PATTERNS = (
+    (re.compile(r'%s(?:, %s)+'), '%s, ...'),
+    (re.compile(r'\b\d+\b'), '?'),
+)
+
+# Поле: (имя метрики, описание, множитель для хранения целым в кеше).
+METRICS = {
+    'requests': ('requests_total', 'Запросы', 1),
+    'queries': ('db_queries_total', 'SQL-запросы', 1),
+    'sql': ('db_seconds_total', 'Время SQL', 10 ** 6),
+    'serializer': ('serializer_seconds_total', 'Время сериализации', 10 ** 6),
+    'duration': ('request_seconds_total', 'Время обработки', 10 ** 6),
+    'response_bytes': ('response_bytes_total', 'Размер ответов', 1),
+    'repeated': ('repeated_queries_total', 'Повторы запросов (N+1)', 1),
+}
+
+_known_views = set()
+
+
+def query_shape(sql):
+    """Форма запроса без значений: IN (%s, %s) и числа схлопываются."""
+    for pattern, replacement in QUERY_SHAPE_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class RequestMetrics:
+    """Счётчики одного запроса: SQL, сериализация, повторы запросов."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.statements = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper."""
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def get_repeated(self, threshold):
+        """Формы запросов, выполненные не меньше threshold раз."""
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[query_shape(sql)] += count
+        return [
+            (shape, count) for shape, count in shapes.most_common()
+            if count >= threshold
+        ]
+
+    def get_server_timing(self, duration):
+        return (
+            f'db;dur={self.sql_time * 1e3:.1f};'
+            f'desc="{self.queries} queries", '
+            f'serializer;dur={self.serializer_time * 1e3:.1f}, '
+            f'total;dur={duration * 1e3:.1f}'
+        )
+
+
+def _incr(key, value):
+    """Атомарно прибавляет value к счётчику в кеше, создавая его.
+
+    incr после вытеснения ключа бросает ValueError, поэтому сначала
+    идёт incr, а add — только когда ключа нет.
+    """
+    try:
+        return cache.incr(key, value)
+    except ValueError:
+        if cache.add(key, value, None):
+            return value
+        return cache.incr(key, value)
+
+
+def register(view):
+    """Добавляет представление в список для export.
+
+    Список хранится отдельными ключами METRICS_VIEWS_KEY с номерами
+    от счётчика, а не одним множеством: чтение и перезапись множества
+    из нескольких процессов теряли бы представления.
+    """
+    if view in _known_views:
+        return
+    if cache.add(METRICS_VIEW_KEY.format(view=view), True, None):
+        number = _incr(METRICS_VIEWS_COUNT_KEY, 1)
+        cache.set(METRICS_VIEWS_KEY.format(number=number), view, None)
+    _known_views.add(view)
+
+
+def get_views():
+    count = cache.get(METRICS_VIEWS_COUNT_KEY, 0)
+    return sorted(set(cache.get_many([
+        METRICS_VIEWS_KEY.format(number=number)
+        for number in range(1, count + 1)
+    ]).values()))
+
+
+def record(view, values):
+    """Прибавляет значения запроса к счётчикам представления в кеше."""
+    register(view)
+    for field, value in values.items():
+        _incr(
+            METRICS_KEY.format(view=view, field=field),
+            round(value * METRICS[field][2])
+        )
+
+
+def export():
+    """Счётчики всех представлений в текстовом формате Prometheus."""
+    views = get_views()
+    values = cache.get_many([
+        METRICS_KEY.format(view=view, field=field)
+        for view in views for field in METRICS
+    ])
+    lines = [
+        f'# HELP {METRICS_PREFIX}_sample_rate Доля запросов в выборке',
+        f'# TYPE {METRICS_PREFIX}_sample_rate gauge',
+        f'{METRICS_PREFIX}_sample_rate {settings.METRICS_SAMPLE_RATE}',
+    ]
+    for field, (name, description, scale) in METRICS.items():
+        name = f'{METRICS_PREFIX}_{name}'
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for view in views:
+            value = values.get(METRICS_KEY.format(view=view, field=field), 0)
+            lines.append(f'{name}{{view="{view}"}} {value / scale:g}')
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def timed_serialization():
+    """Учитывает время сериализации в метриках текущего запроса.
+
+    Считается только внешний вызов, вложенные в него не суммируются.
+    """
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += perf_counter() - started
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    """Учитывает время serializer.data в метриках текущего запроса."""
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
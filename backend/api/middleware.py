@@ -0,0 +1,72 @@
+import random
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import RequestMetrics, current_metrics, logger, record
+
+
+class MetricsMiddleware:
+    """Число и время SQL-запросов, время сериализации и размер ответа.
+
+    Значения отдаются в заголовке Server-Timing и копятся в кеше для
+    /api/metrics/. Запросы попадают в выборку с вероятностью
+    METRICS_SAMPLE_RATE; при METRICS_ENABLED=False middleware
+    отключается целиком и ничего не стоит.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        duration = perf_counter() - started
+        try:
+            self.report(request, response, metrics, duration)
+        except Exception:
+            # Недоступный кеш не должен ронять запрос, который уже
+            # обработан.
+            logger.exception('Не удалось записать метрики запроса')
+        return response
+
+    @staticmethod
+    def report(request, response, metrics, duration):
+        """Server-Timing, предупреждения о N+1 и счётчики в кеше."""
+        view = getattr(request.resolver_match, 'view_name', None) or '-'
+        repeated = metrics.get_repeated(settings.METRICS_REPEATED_QUERIES)
+        for shape, count in repeated:
+            logger.warning(
+                'Возможный N+1 в %s: запрос выполнен %d раз: %s',
+                view, count, shape
+            )
+        response['Server-Timing'] = metrics.get_server_timing(duration)
+        record(view, {
+            'requests': 1,
+            'queries': metrics.queries,
+            'sql': metrics.sql_time,
+            'serializer': metrics.serializer_time,
+            'duration': duration,
+            'response_bytes': (
+                0 if response.streaming else len(response.content)
+            ),
+            'repeated': len(repeated),
+        })
@@ -0,0 +1,120 @@
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import (cc_delim_re, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.timezone import now
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from .cache import get_version
+from .constants import REFERENCE_CACHE_KEY
+
+
+class VersionedCacheMixin:
+    """HTTP-кеширование справочников по версии таблицы.
+
+    ETag строится из версии cache_version (см. api.signals) и пути запроса,
+    поэтому повторная загрузка отвечает 304 или готовыми байтами из кеша
+    без обращения к БД и сериализатору. Vary свежего ответа сохраняется
+    вместе с ним, чтобы общие кеши не смешивали форматы и пользователей.
+    """
+
+    cache_version = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(super().retrieve, request, *args, **kwargs)
+
+    def _cached(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+
+        version = get_version(self.cache_version)
+        path = sha1(request.get_full_path().encode()).hexdigest()
+        key = REFERENCE_CACHE_KEY.format(
+            name=self.cache_version, version=version, path=path
+        )
+        etag = f'"{version}-{path[:16]}"'
+
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response = self.finalize_response(
+                request, response, *args, **kwargs
+            )
+            response.render()
+            cached = (
+                response.content, response['Content-Type'],
+                int(now().timestamp()), response.get('Vary'),
+            )
+            cache.set(key, cached, settings.REFERENCE_CACHE_TIMEOUT)
+
+        content, content_type, last_modified, vary = cached
+        if self._is_not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+
+        if vary:
+            patch_vary_headers(response, cc_delim_re.split(vary))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(
+            response, public=True, max_age=settings.REFERENCE_CACHE_MAX_AGE
+        )
+        return response
+
+    @staticmethod
+    def _is_not_modified(request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return etag in (
+                tag.strip() for tag in if_none_match.split(',')
+            ) or if_none_match.strip() == '*'
+
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        return (
+            if_modified_since is not None
+            and last_modified <= if_modified_since
+        )
+
+
+class CompiledReadMixin:
+    """list и retrieve через CompiledSerializer по строкам .values().
+
+    serializer_class остаётся для схемы API и Browsable API.
+    """
+
+    compiled_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset()).values(
+            *self.compiled_serializer.values
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                self.compiled_serializer.serialize(page, request)
+            )
+        return Response(self.compiled_serializer.serialize(rows, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            self.filter_queryset(self.get_queryset()).values(
+                *self.compiled_serializer.values
+            ),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        return Response(self.compiled_serializer.serialize_one(row, request))
@@ -1,8 +1,173 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
 
-from .constants import PAGINATION_PAGE_SIZE, PAGE_SIZE_QUERY_PARAM
+from django.core.exceptions import (FieldDoesNotExist, ImproperlyConfigured,
+                                    ValidationError)
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+from .constants import (CURSOR_QUERY_PARAM, PAGINATION_PAGE_SIZE,
+                        PAGE_SIZE_QUERY_PARAM)
+
+
+class FoodgramCursorPagination(CursorPagination):
+    """Keyset-пагинация: время выборки не зависит от глубины страницы.
+
+    Сортировка берётся из queryset (?ordering=, ранг поиска), а если её
+    нет — из view.cursor_ordering или ordering; в конец добавляется id,
+    чтобы ключ был уникальным. Курсор хранит значения всех полей
+    сортировки крайней записи страницы, и следующая страница выбирается
+    условием (a, b, id) < (va, vb, vid) без OFFSET. Курсор, выданный
+    для другой сортировки, отклоняется.
+    """
+
+    page_size = PAGINATION_PAGE_SIZE
+    page_size_query_param = PAGE_SIZE_QUERY_PARAM
+    cursor_query_param = CURSOR_QUERY_PARAM
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [
+            self._get_field(queryset.model, field.lstrip('-'))
+            for field in self.ordering
+        ]
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, reverse))
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._invert(field) for field in ordering]
+
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(queryset.query.order_by) or list(
+            getattr(view, 'cursor_ordering', self.ordering)
+        )
+        for field in ordering:
+            if not isinstance(field, str) or '__' in field:
+                raise ImproperlyConfigured(
+                    f'{type(self).__name__}: сортировка {field!r} не '
+                    'поддерживается, нужны поля модели или аннотации.'
+                )
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append(
+                '-id' if ordering[-1].startswith('-') else 'id'
+            )
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        """(значения полей сортировки, обратное направление) из курсора."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            ordering, position, reverse = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii'))
+            )
+            if ordering != self.ordering or len(position) != len(ordering):
+                raise ValueError
+            position = [
+                value if field is None else field.to_python(value)
+                for field, value in zip(self.fields, position)
+            ]
+        except (
+            TypeError, ValueError, UnicodeError, binascii.Error,
+            ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+    def encode_cursor(self, instance, reverse):
+        position = [
+            self._to_json(getattr(instance, field.lstrip('-')))
+            for field in self.ordering
+        ]
+        encoded = urlsafe_b64encode(json.dumps(
+            [self.ordering, position, int(reverse)], separators=(',', ':')
+        ).encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def _after(self, position, reverse):
+        """Записи строго после position в порядке self.ordering."""
+        condition, equal = Q(), {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _get_field(model, name):
+        """Поле модели для разбора значения из курсора; None — аннотация."""
+        if name == 'pk':
+            return model._meta.pk
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    @staticmethod
+    def _to_json(value):
+        # Микросекунды нужны целиком, DjangoJSONEncoder их обрезает.
+        return value.isoformat() if isinstance(value, datetime) else value
 
 
 class FoodgramPagination(PageNumberPagination):
+    """Постраничная пагинация с опциональным режимом курсора.
+
+    Параметр cursor (в том числе пустой для первой страницы) включает
+    FoodgramCursorPagination, без него работает привычный page/limit.
+    """
+
     page_size = PAGINATION_PAGE_SIZE
     page_size_query_param = PAGE_SIZE_QUERY_PARAM
+    cursor_pagination_class = FoodgramCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if CURSOR_QUERY_PARAM in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
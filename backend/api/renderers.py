@@ -0,0 +1,67 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson, вывод совпадает со stdlib json почти везде.
+
+    orjson, как и DRF с UNICODE_JSON и COMPACT_JSON, пишет UTF-8 без
+    пробелов. Неэкранированные U+2028/U+2029 экранируются здесь, даты
+    и прочие нестандартные типы отдаются кодировщику DRF. Отличия
+    остаются во float: экспонента пишется как 1e16 и 1e-7, а не 1e+16
+    и 1e-07, а NaN и бесконечности становятся null вместо ValueError,
+    поэтому float в ответах API держим в диапазоне, где запись
+    одинакова (см. COOKABLE_COVERAGE_DIGITS). С отступом (?format=json
+    с indent, Browsable API), без orjson и на том, что orjson не умеет
+    (целые длиннее 64 бит), работает обычный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=(
+                    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                ),
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return ret
+
+
+class ShoppingListRenderer(FastJSONRenderer):
+    """Делает формат списка покупок допустимым для ?format=.
+
+    Сам файл отдаётся потоковым ответом в обход рендерера,
+    а ошибки по-прежнему рендерятся как JSON.
+    """
+
+
+class ShoppingListTxtRenderer(ShoppingListRenderer):
+    format = 'txt'
+
+
+class ShoppingListCsvRenderer(ShoppingListRenderer):
+    format = 'csv'
+
+
+class ShoppingListPdfRenderer(ShoppingListRenderer):
+    format = 'pdf'
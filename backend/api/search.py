@@ -0,0 +1,451 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import groupby, islice
+from threading import Lock
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+from recipe.models import Ingredient, IngredientRecipe, Recipe
+from .cache import ChangeLog, get_version
+from .constants import (INGREDIENTS_VERSION, RECIPE_CHANGES_MAX,
+                        RECIPE_CHANGES_VERSION, RECIPE_SEARCH_CONFIG,
+                        RECIPE_SEARCH_ENDINGS, RECIPE_SEARCH_LIMIT,
+                        RECIPE_SEARCH_MIN_STEM, RECIPE_SEARCH_NAME_WEIGHT,
+                        RECIPE_SEARCH_TEXT_WEIGHT)
+from .serializers import compiled_ingredients
+
+WORD_RE = re.compile(r'\w+')
+
+
+class IngredientIndex:
+    """Отсортированный индекс ингредиентов в памяти процесса.
+
+    Строится лениво при первом запросе и перестраивается, когда версия
+    INGREDIENTS_VERSION в кеше меняется (см. api.signals), поэтому
+    изменения видны всем воркерам, использующим общий кеш.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = []
+        self._rows = []
+        self._text = ''
+        self._offsets = []
+
+    def search(self, query='', limit=None):
+        """Ингредиенты, чьё название начинается с query или содержит его.
+
+        Сначала идут точные совпадения, затем совпадения по префиксу,
+        затем по вхождению; внутри групп порядок алфавитный.
+        """
+        keys, rows = self._get_index()
+        query = query.casefold().replace('\n', ' ')
+        if not query:
+            return rows[:limit]
+
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = rows[start:end]
+
+        if limit is None or len(result) < limit:
+            result.extend(islice(
+                (
+                    rows[index] for index in self._find_containing(query)
+                    if not start <= index < end
+                ),
+                None if limit is None else limit - len(result)
+            ))
+        return result[:limit]
+
+    def _find_containing(self, query):
+        """Индексы названий, содержащих query, через str.find по склейке."""
+        text, offsets = self._text, self._offsets
+        position = text.find(query)
+        while position != -1:
+            index = bisect_left(offsets, position + 1) - 1
+            yield index
+            position = text.find(query, offsets[index + 1])
+
+    def _get_index(self):
+        version = get_version(INGREDIENTS_VERSION)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build(version)
+        return self._keys, self._rows
+
+    def _build(self, version):
+        ingredients = sorted(
+            Ingredient.objects.values(*compiled_ingredients.values).order_by(),
+            key=lambda row: (
+                row['name'].casefold(), row['name'],
+                row['measurement_unit'], row['id'],
+            )
+        )
+        keys = [row['name'].casefold() for row in ingredients]
+        rows = compiled_ingredients.serialize(ingredients)
+        offsets, position = [], 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + 1
+        offsets.append(position)
+        self._text = '\n'.join(keys)
+        self._offsets = offsets
+        self._keys, self._rows, self._version = keys, rows, version
+
+
+ingredient_index = IngredientIndex()
+
+
+def stem(word):
+    """Грубое отсечение русских окончаний для индекса в памяти."""
+    for ending in RECIPE_SEARCH_ENDINGS:
+        if (
+            word.endswith(ending)
+            and len(word) - len(ending) >= RECIPE_SEARCH_MIN_STEM
+        ):
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [
+        stem(word) for word in WORD_RE.findall(
+            text.casefold().replace('ё', 'е')
+        )
+    ]
+
+
+class RecipeSearchIndex:
+    """Обратный индекс рецептов в памяти процесса для SQLite.
+
+    Повторяет поиск PostgreSQL по search_vector: все слова запроса
+    должны встретиться в названии или описании, совпадения в названии
+    весят больше. Как и CookableIndex, изменённые рецепты дочитываются
+    по журналу recipe_changes, полная перестройка нужна только при
+    разрыве журнала.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._postings = {}
+        self._terms = {}
+
+    def search(self, query, limit=None, candidates=None):
+        """id рецептов по убыванию релевантности, новые выше при равенстве.
+
+        candidates — множество id, среди которых идёт поиск (None — все
+        рецепты), поэтому limit применяется уже после фильтров.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        self._refresh()
+        with self._lock:
+            matches = [self._postings.get(term, {}) for term in terms]
+            matches.sort(key=len)
+            ranks = {
+                pk: rank for pk, rank in matches[0].items()
+                if candidates is None or pk in candidates
+            }
+            for match in matches[1:]:
+                ranks = {
+                    pk: rank + match[pk]
+                    for pk, rank in ranks.items() if pk in match
+                }
+        return sorted(
+            ranks, key=lambda pk: (-ranks[pk], -pk)
+        )[:limit]
+
+    def _refresh(self):
+        current = recipe_changes.get_version()
+        if current == self._version:
+            return
+        with self._lock:
+            if current == self._version:
+                return
+            changed = recipe_changes.changes_since(self._version, current)
+            if changed is None:
+                self._build()
+            else:
+                self._update(changed)
+            self._version = current
+
+    def _build(self):
+        self._postings, self._terms = {}, {}
+        for pk, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ).order_by().iterator():
+            self._add(pk, name, text)
+
+    def _update(self, recipe_ids):
+        for pk in recipe_ids:
+            self._remove(pk)
+        for pk, name, text in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('id', 'name', 'text').order_by():
+            self._add(pk, name, text)
+
+    def _add(self, pk, name, text):
+        weights = defaultdict(float)
+        for term in tokenize(name):
+            weights[term] += RECIPE_SEARCH_NAME_WEIGHT
+        for term in tokenize(text):
+            weights[term] += RECIPE_SEARCH_TEXT_WEIGHT
+        self._terms[pk] = tuple(weights)
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[pk] = weight
+
+    def _remove(self, pk):
+        for term in self._terms.pop(pk, ()):
+            postings = self._postings[term]
+            del postings[pk]
+            if not postings:
+                del self._postings[term]
+
+
+recipe_index = RecipeSearchIndex()
+
+recipe_changes = ChangeLog(RECIPE_CHANGES_VERSION, RECIPE_CHANGES_MAX)
+
+
+def to_bits(slots, size):
+    """Битовая маска (int) с единицами в позициях slots."""
+    data = bytearray((size + 7) // 8)
+    for slot in slots:
+        data[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(data, 'little')
+
+
+class CookableIndex:
+    """Битовые маски рецептов по ингредиентам для «что приготовить».
+
+    Каждому рецепту выделен слот (номер бита) в порядке возрастания id.
+    Для ингредиента, тега и размера рецепта хранится маска рецептов.
+    Число совпадений считается побитовым сложением масок ингредиентов
+    запроса, поэтому время запроса почти не зависит от того, насколько
+    популярны ингредиенты. Изменённые рецепты дочитываются по журналу
+    recipe_changes, полная перестройка нужна только при разрыве журнала.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._slots = []
+        self._slot_of = {}
+        self._ingredients = {}
+        self._tags = {}
+        self._ingredient_bits = {}
+        self._tag_bits = {}
+        self._size_bits = {}
+
+    def search(self, ingredient_ids, limit, tag_ids=None, match_all=False):
+        """Топ-limit рецептов по доле имеющихся ингредиентов.
+
+        Возвращает список (recipe_id, coverage, missing), где coverage —
+        доля ингредиентов рецепта из ingredient_ids, missing — сколько
+        ингредиентов не хватает. При равной доле выше рецепты, которым
+        не хватает меньшего, затем более новые.
+        """
+        self._refresh()
+        with self._lock:
+            planes = self._count(set(ingredient_ids))
+            allowed = self._get_tag_mask(tag_ids, match_all)
+            buckets = groupby(
+                sorted(
+                    (
+                        (hits / size, size - hits, hits, size)
+                        for size in self._size_bits
+                        for hits in range(
+                            1, min(size, 2 ** len(planes) - 1) + 1
+                        )
+                    ),
+                    key=lambda bucket: (-bucket[0], bucket[1])
+                ),
+                key=lambda bucket: bucket[:2]
+            )
+            result = []
+            for (coverage, missing), group in buckets:
+                mask = 0
+                for _, _, hits, size in group:
+                    size_mask = self._size_bits[size] & allowed
+                    for number, plane in enumerate(planes):
+                        size_mask &= (
+                            plane if hits >> number & 1 else ~plane
+                        )
+                    mask |= size_mask
+                while mask and len(result) < limit:
+                    slot = mask.bit_length() - 1
+                    mask ^= 1 << slot
+                    result.append((self._slots[slot], coverage, missing))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def _count(self, ingredient_ids):
+        """Побитовый счётчик: planes[n] — n-й бит числа совпадений."""
+        planes = []
+        for ingredient_id in ingredient_ids:
+            carry = self._ingredient_bits.get(ingredient_id, 0)
+            for number, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[number], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        return planes
+
+    def _get_tag_mask(self, tag_ids, match_all):
+        if not tag_ids:
+            return -1
+        masks = [self._tag_bits.get(tag_id, 0) for tag_id in tag_ids]
+        result = masks[0]
+        for mask in masks[1:]:
+            result = result & mask if match_all else result | mask
+        return result
+
+    def _refresh(self):
+        current = recipe_changes.get_version()
+        if current == self._version:
+            return
+        with self._lock:
+            if current == self._version:
+                return
+            changed = recipe_changes.changes_since(self._version, current)
+            if changed is None or not self._update(changed):
+                self._build()
+            self._version = current
+
+    def _build(self):
+        ingredients, tags = self._load(Recipe.objects.all())
+        self._slots = sorted(ingredients)
+        self._slot_of = {
+            recipe_id: slot for slot, recipe_id in enumerate(self._slots)
+        }
+        self._ingredients, self._tags = ingredients, tags
+        self._ingredient_bits = self._group_bits(ingredients)
+        self._tag_bits = self._group_bits(tags)
+        self._size_bits = self._group_bits({
+            recipe_id: (len(recipe_ingredients), )
+            for recipe_id, recipe_ingredients in ingredients.items()
+        })
+
+    def _group_bits(self, groups):
+        slots = defaultdict(list)
+        for recipe_id, keys in groups.items():
+            for key in keys:
+                slots[key].append(self._slot_of[recipe_id])
+        return {
+            key: to_bits(key_slots, len(self._slots))
+            for key, key_slots in slots.items()
+        }
+
+    def _update(self, recipe_ids):
+        """Применяет изменения рецептов; False — нужна полная перестройка.
+
+        Новые рецепты получают слоты в конце, поэтому их id должны быть
+        больше уже известных, иначе порядок слотов разойдётся с id.
+        """
+        ingredients, tags = self._load(
+            Recipe.objects.filter(pk__in=recipe_ids)
+        )
+        new_ids = sorted(set(ingredients) - self._slot_of.keys())
+        if new_ids and self._slots and new_ids[0] < self._slots[-1]:
+            return False
+        for recipe_id in recipe_ids:
+            if recipe_id in self._slot_of:
+                self._remove(recipe_id)
+        for recipe_id in new_ids:
+            self._slot_of[recipe_id] = len(self._slots)
+            self._slots.append(recipe_id)
+        for recipe_id, recipe_ingredients in ingredients.items():
+            self._add(recipe_id, recipe_ingredients, tags[recipe_id])
+        return True
+
+    def _add(self, recipe_id, ingredients, tags):
+        bit = 1 << self._slot_of[recipe_id]
+        self._ingredients[recipe_id], self._tags[recipe_id] = ingredients, tags
+        for bits, keys in (
+            (self._ingredient_bits, ingredients),
+            (self._tag_bits, tags),
+            (self._size_bits, (len(ingredients), )),
+        ):
+            for key in keys:
+                bits[key] = bits.get(key, 0) | bit
+
+    def _remove(self, recipe_id):
+        bit = 1 << self._slot_of[recipe_id]
+        ingredients = self._ingredients.pop(recipe_id, frozenset())
+        for bits, keys in (
+            (self._ingredient_bits, ingredients),
+            (self._tag_bits, self._tags.pop(recipe_id, ())),
+            (self._size_bits, (len(ingredients), ) if ingredients else ()),
+        ):
+            for key in keys:
+                bits[key] &= ~bit
+
+    @staticmethod
+    def _load(recipes):
+        """Составы и теги рецептов: ({id: ингредиенты}, {id: теги})."""
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe__in=recipes
+        ).values_list('recipe_id', 'ingredient_id').order_by().iterator():
+            ingredients[recipe_id].add(ingredient_id)
+        tags = defaultdict(set)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe__in=recipes
+        ).values_list('recipe_id', 'tag_id').order_by().iterator():
+            tags[recipe_id].add(tag_id)
+        return (
+            {
+                recipe_id: frozenset(recipe_ingredients)
+                for recipe_id, recipe_ingredients in ingredients.items()
+            },
+            {
+                recipe_id: frozenset(tags[recipe_id])
+                for recipe_id in ingredients
+            },
+        )
+
+
+cookable_index = CookableIndex()
+
+
+def search_recipes(queryset, query):
+    """Рецепты queryset, подходящие под query, по убыванию релевантности.
+
+    На PostgreSQL используется search_vector с GIN-индексом, на
+    остальных БД — recipe_index, ограниченный RECIPE_SEARCH_LIMIT
+    лучшими совпадениями среди рецептов, прошедших фильтры queryset.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=RECIPE_SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+    candidates = None
+    if queryset.query.has_filters():
+        candidates = set(queryset.values_list('pk', flat=True).order_by())
+    recipe_ids = recipe_index.search(query, RECIPE_SEARCH_LIMIT, candidates)
+    if not recipe_ids:
+        return queryset.none()
+    return queryset.filter(pk__in=recipe_ids).annotate(
+        search_rank=Case(
+            *(
+                When(pk=pk, then=Value(-position))
+                for position, pk in enumerate(recipe_ids)
+            ),
+            output_field=IntegerField(),
+        )
+    ).order_by('-search_rank', '-pub_date', '-id')
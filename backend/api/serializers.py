@@ -1,29 +1,41 @@
 from django.contrib.auth import get_user_model
+from django.db import models, transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 
 from recipe.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                           ShoppingCart, Tag)
+                           ShoppingCart, ShoppingListItem, Tag)
 from users.models import Follow
-from .utils import Base64ImageField
+from .cache import recipe_representations
+from .compiled import CompiledSerializer
+from .constants import (COOKABLE_COVERAGE_DIGITS, COOKABLE_LIMIT_MAX,
+                        PAGINATION_PAGE_SIZE, TAGS_MODE_ALL, TAGS_MODE_ANY)
+from .metrics import TimedListSerializer, TimedSerializerMixin
+from .utils import (Base64ImageField, ImageRenditionsField,
+                    parse_recipes_limit)
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для списка пользователей."""
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_renditions = ImageRenditionsField('avatar')
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name',
-            'last_name', 'is_subscribed', 'avatar',
+            'last_name', 'is_subscribed', 'avatar', 'avatar_renditions',
         )
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+
         request = self.context.get('request')
         return (
             request
@@ -42,18 +54,26 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ('avatar', )
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug')
+        list_serializer_class = TimedListSerializer
+
+
+compiled_tags = CompiledSerializer(TagSerializer)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
+        list_serializer_class = TimedListSerializer
+
+
+compiled_ingredients = CompiledSerializer(IngredientSerializer)
 
 
 class IngredientRecipeSerializer(serializers.ModelSerializer):
@@ -77,7 +97,23 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(TimedListSerializer):
+    """Список рецептов одним обращением к кешу представлений."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        return self.child.to_representation_many(list(iterable))
+
+
+class RecipeReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Рецепт для чтения.
+
+    Теги, автор, ингредиенты, картинка и текст не зависят от зрителя
+    и берутся из recipe_representations; is_favorited,
+    is_in_shopping_cart и author.is_subscribed подставляются поверх
+    из аннотаций Recipe.objects.with_viewer_flags.
+    """
+
     tags = TagSerializer(many=True)
     author = UserSerializer()
     ingredients = IngredientInRecipeSerializer(
@@ -85,6 +121,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_renditions = ImageRenditionsField('image')
 
     class Meta:
         model = Recipe
@@ -92,10 +129,51 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'id', 'tags', 'author',
             'ingredients', 'is_favorited',
             'is_in_shopping_cart', 'name',
-            'image', 'text', 'cooking_time'
+            'image', 'image_renditions', 'text', 'cooking_time'
+        )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes):
+        request = self.context.get('request')
+        viewer = getattr(request, 'user', None)
+        stamps = recipe_representations.get_stamps(
+            {recipe.pk for recipe in recipes},
+            request.build_absolute_uri('/') if request else '',
         )
+        cached = recipe_representations.get_many(stamps)
+        missing = stamps.keys() - cached.keys()
+        if missing:
+            # Промахи перечитываются после штампов, чтобы не положить
+            # в кеш данные, прочитанные до правки рецепта. Флаги зрителя
+            # переносятся со страницы, чтобы не считать их заново.
+            page = {recipe.pk: recipe for recipe in recipes}
+            fresh = {}
+            for recipe in Recipe.objects.with_related(viewer).filter(
+                pk__in=missing
+            ):
+                for flag in ('is_favorited', 'is_in_shopping_cart'):
+                    if hasattr(page[recipe.pk], flag):
+                        setattr(recipe, flag, getattr(page[recipe.pk], flag))
+                fresh[recipe.pk] = super().to_representation(recipe)
+            recipe_representations.set_many(fresh, stamps)
+            cached.update(fresh)
+
+        result = []
+        for recipe in recipes:
+            data = cached.get(recipe.pk)
+            if data is None:
+                # Рецепт удалён после загрузки страницы.
+                data = super().to_representation(recipe)
+            result.append(self._add_viewer_flags(data, recipe))
+        return result
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+
         request = self.context.get('request')
 
         return (
@@ -107,6 +185,9 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+
         request = self.context.get('request')
 
         return (
@@ -117,6 +198,74 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             ).exists()
         )
 
+    def get_author_is_subscribed(self, obj):
+        if hasattr(obj, 'author_is_subscribed'):
+            return obj.author_is_subscribed
+        return self.fields['author'].get_is_subscribed(obj.author)
+
+    def _add_viewer_flags(self, data, recipe):
+        data = dict(data)
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        data['author'] = dict(
+            data['author'],
+            is_subscribed=self.get_author_is_subscribed(recipe)
+        )
+        return data
+
+
+class CookableRecipeSerializer(RecipeReadSerializer):
+    """Рецепт с долей имеющихся ингредиентов и числом недостающих.
+
+    coverage и missing зависят от запроса, поэтому добавляются поверх
+    закешированного представления RecipeReadSerializer. coverage
+    округляется до COOKABLE_COVERAGE_DIGITS знаков.
+    """
+
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('coverage', 'missing')
+
+    def to_representation_many(self, recipes):
+        representations = RecipeReadSerializer(
+            context=self.context
+        ).to_representation_many(recipes)
+        return [
+            dict(
+                data,
+                coverage=round(
+                    self.fields['coverage'].to_representation(
+                        recipe.coverage
+                    ),
+                    COOKABLE_COVERAGE_DIGITS,
+                ),
+                missing=self.fields['missing'].to_representation(
+                    recipe.missing
+                ),
+            )
+            for data, recipe in zip(representations, recipes)
+        ]
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    """Параметры запроса «что приготовить из имеющихся ингредиентов»."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False
+    )
+    tags = serializers.ListField(
+        child=serializers.SlugField(), required=False
+    )
+    tags_mode = serializers.ChoiceField(
+        choices=(TAGS_MODE_ANY, TAGS_MODE_ALL), default=TAGS_MODE_ANY
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=COOKABLE_LIMIT_MAX,
+        default=PAGINATION_PAGE_SIZE
+    )
+
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
@@ -169,14 +318,19 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
 
         ingredients = validated_data.pop('ingredients', [])
         tags = validated_data.pop('tags', [])
         instance = super().update(instance, validated_data)
         instance.tags.set(tags)
+        old_amounts = dict(
+            instance.recipes.values_list('ingredient_id', 'amount')
+        )
         IngredientRecipe.objects.filter(recipe=instance).delete()
         self._create_ingredients(instance, ingredients)
+        ShoppingListItem.objects.change_recipe(instance, old_amounts)
         return instance
 
     def to_representation(self, instance):
@@ -184,6 +338,8 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def _create_ingredients(recipe, ingredients):
+        # bulk_create не шлёт post_save, который сбрасывает кеш.
+        recipe_representations.forget_on_commit((recipe.pk, ))
         IngredientRecipe.objects.bulk_create(
             IngredientRecipe(
                 recipe=recipe,
@@ -193,16 +349,22 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             for ingredient in ingredients)
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор модели Recipe для возврата краткой информации о рецетпте.
 
     """
 
+    image_renditions = ImageRenditionsField('image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         read_only_fields = fields
+        list_serializer_class = TimedListSerializer
+
+
+compiled_short_recipes = CompiledSerializer(RecipeShortSerializer)
 
 
 class SubscriptionsSerializer(UserSerializer):
@@ -216,25 +378,26 @@ class SubscriptionsSerializer(UserSerializer):
         fields = (
             'email', 'id', 'username', 'first_name',
             'last_name', 'is_subscribed',
-            'recipes', 'recipes_count', 'avatar'
+            'recipes', 'recipes_count', 'avatar', 'avatar_renditions'
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        user_recipes = obj.recipes.all()
-        limit = request.GET.get('recipes_limit')
-        try:
-            if limit and int(limit) > 0:
-                user_recipes = user_recipes[:int(limit)]
-
-        except (IndexError, TypeError):
-            pass
-
-        return RecipeShortSerializer(
-            user_recipes, many=True, context=self.context
-        ).data
+        """Строки recipes_preview готовит представление подписок."""
+        if hasattr(obj, 'recipes_preview'):
+            user_recipes = obj.recipes_preview
+        else:
+            user_recipes = obj.recipes.values(*compiled_short_recipes.values)
+            limit = parse_recipes_limit(self.context.get('request'))
+            if limit:
+                user_recipes = user_recipes[:limit]
+
+        return compiled_short_recipes.serialize(
+            user_recipes, self.context.get('request')
+        )
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -287,7 +450,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
         ]
 
     def to_representation(self, instance):
-        return RecipeShortSerializer(instance.recipe).data
+        return compiled_short_recipes.serialize_instance(instance.recipe)
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -305,4 +468,4 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         ]
 
     def to_representation(self, instance):
-        return RecipeShortSerializer(instance.recipe).data
+        return compiled_short_recipes.serialize_instance(instance.recipe)
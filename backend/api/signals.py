@@ -0,0 +1,179 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipe.models import (Favorite, FeedItem, Ingredient, IngredientRecipe,
+                           Recipe, ShoppingCart, ShoppingListItem, Tag,
+                           encode_short_link)
+from users.models import Follow
+from .authentication import CachedTokenAuthentication
+from .cache import bump_version, recipe_representations, short_link_cache
+from .constants import (INGREDIENTS_VERSION, RECIPE_CHANGES_VERSION,
+                        RECIPES_VERSION, SHOPPING_CART_VERSION,
+                        SHOPPING_LIST_VERSION, TAGS_VERSION)
+from .feeds import submit_fan_out
+from .images import schedule_renditions
+from .search import recipe_changes
+from .serializers import UserSerializer
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_shopping_cart(sender, instance, **kwargs):
+    """Версия меняется после коммита: иначе параллельное скачивание
+    успело бы закешировать старые строки под новым ключом."""
+    version = SHOPPING_CART_VERSION.format(instance.user_id)
+    transaction.on_commit(lambda: bump_version(version))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, instance, **kwargs):
+    bump_version(TAGS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, instance, **kwargs):
+    bump_version(INGREDIENTS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_shopping_lists(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_version(SHOPPING_LIST_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipes(sender, instance, **kwargs):
+    bump_version(RECIPES_VERSION)
+
+
+def record_recipe_changes(recipe_ids):
+    recipe_representations.forget_on_commit(recipe_ids)
+
+    def record():
+        for recipe_id in recipe_ids:
+            recipe_changes.record(recipe_id)
+    transaction.on_commit(record)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def record_recipe_change(sender, instance, **kwargs):
+    record_recipe_changes(
+        (instance.pk if sender is Recipe else instance.recipe_id, )
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def record_recipe_tags_change(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        record_recipe_changes((instance.pk, ))
+    elif pk_set:
+        record_recipe_changes(pk_set)
+    else:
+        bump_version(RECIPE_CHANGES_VERSION)
+        # Теги входят в штамп кеша представлений рецептов.
+        bump_version(TAGS_VERSION)
+
+
+@receiver(post_delete, sender=Tag)
+def reset_recipe_changes(sender, instance, **kwargs):
+    """Каскадное удаление связей с тегом не шлёт m2m_changed."""
+    bump_version(RECIPE_CHANGES_VERSION)
+
+
+@receiver(post_save, sender=User)
+def forget_author_recipe_representations(sender, instance, created,
+                                         update_fields, **kwargs):
+    """Профиль автора входит в представления его рецептов."""
+    if created or update_fields is not None and not (
+        set(update_fields) & set(UserSerializer.Meta.fields)
+    ):
+        return
+    recipe_representations.forget_on_commit(
+        instance.recipes.values_list('pk', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_recipe_everywhere(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def cache_short_link(sender, instance, **kwargs):
+    """Без кода Recipe.save выдаст encode_short_link(pk) после post_save."""
+    short_link_cache.store(
+        instance.short_link or encode_short_link(instance.pk), instance.pk
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: submit_fan_out(instance))
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed(sender, instance, created, **kwargs):
+    if created:
+        FeedItem.objects.add_author(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(sender, instance, **kwargs):
+    FeedItem.objects.remove_author(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance, **kwargs):
+    if instance.short_link:
+        short_link_cache.forget(instance.short_link)
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    CachedTokenAuthentication.revoke(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    """Смена пароля, деактивация и другие правки пользователя."""
+    if not created:
+        CachedTokenAuthentication.revoke(instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def collect_user_recipes(sender, instance, **kwargs):
+    """Рецепты, чьи счётчики изменит каскадное удаление пользователя."""
+    instance._counter_recipe_ids = set(
+        Favorite.objects.filter(user=instance).values_list(
+            'recipe_id', flat=True
+        )
+    ) | set(
+        ShoppingCart.objects.filter(user=instance).values_list(
+            'recipe_id', flat=True
+        )
+    )
+
+
+@receiver(post_delete, sender=User)
+def refresh_user_recipe_counters(sender, instance, **kwargs):
+    recipe_ids = getattr(instance, '_counter_recipe_ids', None)
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).refresh_counters()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def render_image(sender, instance, update_fields, **kwargs):
+    field_name = 'image' if sender is Recipe else 'avatar'
+    if update_fields is None or field_name in update_fields:
+        schedule_renditions(instance, field_name)
@@ -0,0 +1,809 @@
+import base64
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from recipe.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                           ShoppingCart, Tag, encode_short_link)
+from users.models import Follow
+from .authentication import CachedTokenAuthentication
+from .cache import ChangeLog, get_version, short_link_cache
+from .constants import (COOKABLE_COVERAGE_DIGITS, IMAGE_RENDITIONS,
+                        IMAGE_SOURCE_KEY, METRICS_KEY, SHOPPING_CART_VERSION)
+from .images import decode_data_url, generate_renditions
+from .importers import iter_json_array
+from .metrics import _known_views, export, record
+from .renderers import FastJSONRenderer, orjson
+from .search import recipe_index
+from .utils import ShoppingCartDownloader
+
+User = get_user_model()
+
+
+def make_png(size=(40, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'png')
+    return buffer.getvalue()
+
+
+def make_data_url(content):
+    return 'data:image/png;base64,' + base64.b64encode(content).decode()
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name,
+        first_name=name, last_name=name, password='password-123',
+    )
+
+
+class QueryCountTest(APITestCase):
+    """Число запросов на страницу не зависит от её размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        for index in range(3):
+            author = create_user(f'author{index}')
+            Follow.objects.create(user=cls.viewer, following=author)
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author, name=f'Рецепт {number}', text='Текст',
+                    cooking_time=number + 1, image='recipes/image.jpg',
+                )
+                for number in range(60)
+            )
+            recipes = Recipe.objects.filter(author=author)
+            for recipe in recipes:
+                recipe.tags.set(tags[:2])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+                for recipe in recipes for ingredient in ingredients[:3]
+            )
+            Favorite.objects.bulk_create(
+                Favorite(user=cls.viewer, recipe=recipe)
+                for recipe in recipes[:10]
+            )
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=cls.viewer, recipe=recipe)
+                for recipe in recipes[:5]
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+
+    def assertConstantQueries(self, num, url, param, get_items):
+        for size in (6, 50):
+            cache.clear()
+            with self.subTest(size=size):
+                with self.assertNumQueries(num):
+                    response = self.client.get(f'{url}?{param}={size}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(get_items(response.data)), size)
+
+    def test_recipe_list(self):
+        self.assertConstantQueries(
+            6, '/api/recipes/', 'limit', lambda data: data['results'],
+        )
+
+    def test_subscriptions(self):
+        self.assertConstantQueries(
+            3, '/api/users/subscriptions/', 'recipes_limit',
+            lambda data: data['results'][0]['recipes'],
+        )
+
+
+class ShoppingListDownloadTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/image.jpg',
+        )
+        IngredientRecipe.objects.create(
+            recipe=cls.recipe, amount=10,
+            ingredient=Ingredient.objects.create(
+                name='Мука', measurement_unit='г'
+            ),
+        )
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_cart_version_changes_after_commit(self):
+        name = SHOPPING_CART_VERSION.format(self.user.pk)
+        version = get_version(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.filter(user=self.user).delete()
+            self.assertEqual(get_version(name), version)
+        self.assertNotEqual(get_version(name), version)
+
+    @skipUnless(
+        os.path.exists(settings.SHOPPING_LIST_PDF_FONT), 'Нет шрифта для PDF'
+    )
+    def test_pdf(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=pdf'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(
+            b'%PDF'
+        ))
+
+    @override_settings(SHOPPING_LIST_PDF_FONT='/nonexistent/font.ttf')
+    @mock.patch.object(ShoppingCartDownloader, 'pdf_font_name', 'Missing')
+    def test_pdf_without_font(self):
+        with self.assertLogs('api.utils', 'ERROR'):
+            self.assertFalse(ShoppingCartDownloader.is_supported('pdf'))
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/?format=pdf'
+            )
+        self.assertEqual(response.status_code, 400)
+
+
+class ShortLinkTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+
+    def setUp(self):
+        cache.clear()
+        short_link_cache.local.clear()
+
+    def create_recipe(self, **kwargs):
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/image.jpg', **kwargs
+        )
+
+    def test_create_sends_post_save_once(self):
+        handler = mock.Mock()
+        post_save.connect(handler, sender=Recipe)
+        try:
+            recipe = self.create_recipe()
+        finally:
+            post_save.disconnect(handler, sender=Recipe)
+        self.assertEqual(handler.call_count, 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.short_link, encode_short_link(recipe.pk))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                short_link_cache.resolve(recipe.short_link), recipe.pk
+            )
+
+    def test_backfill_all_forgets_old_codes(self):
+        recipe = self.create_recipe(short_link='old123')
+        self.assertEqual(short_link_cache.resolve('old123'), recipe.pk)
+        call_command('backfill_short_links', all=True, stdout=StringIO())
+        self.assertIsNone(short_link_cache.resolve('old123'))
+        self.assertEqual(
+            short_link_cache.resolve(encode_short_link(recipe.pk)), recipe.pk
+        )
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    """Отзыв токена виден процессам, в чьём LRU он ещё лежит."""
+
+    def setUp(self):
+        cache.clear()
+        CachedTokenAuthentication.cache.clear()
+        self.user = create_user('reader')
+        self.token = Token.objects.create(user=self.user)
+        # delete() обнуляет pk, а у Token это и есть ключ.
+        self.key = self.token.key
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def assertRevoked(self):
+        self.assertIsNotNone(CachedTokenAuthentication.cache.get(self.key))
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_deactivation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertRevoked()
+
+    def test_logout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertRevoked()
+
+
+class ImportRecipesTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        media_settings = self.settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def make_recipe(self, name, amount=10, cooking_time=5, image=''):
+        data = {
+            'name': name, 'image': image, 'tags': [self.tag.pk],
+            'cooking_time': cooking_time,
+            'ingredients': [{'id': self.ingredient.pk, 'amount': amount}],
+        }
+        if amount is None:
+            del data['ingredients'][0]['amount']
+        return data
+
+    def import_recipes(self, recipes):
+        path = os.path.join(self.media_root, 'recipes.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(recipes, file)
+        stdout = StringIO()
+        call_command('import_recipes', path, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_invalid_values_are_skipped(self):
+        output = self.import_recipes([
+            self.make_recipe('Без количества', amount=None),
+            self.make_recipe('Много', amount=32001),
+            self.make_recipe('Ноль', amount=0),
+            self.make_recipe('Долго', cooking_time=32001),
+            self.make_recipe('Строкой', cooking_time='5'),
+            self.make_recipe('Блины'),
+        ])
+        self.assertIn('Импортировано рецептов: 1', output)
+        self.assertEqual(output.count('пропущен'), 5)
+        self.assertEqual(
+            list(Recipe.objects.values_list('name', flat=True)), ['Блины']
+        )
+
+    def assertNoImages(self):
+        self.assertEqual(
+            [files for _, _, files in os.walk(self.media_root)],
+            [['recipes.json'], [], []],
+        )
+
+    def test_images_removed_on_rollback(self):
+        with mock.patch.object(
+            IngredientRecipe.objects, 'bulk_create',
+            side_effect=RuntimeError,
+        ), self.assertRaises(RuntimeError):
+            self.import_recipes([
+                self.make_recipe(name, image=make_data_url(make_png()))
+                for name in ('Блины', 'Хлеб')
+            ])
+        self.assertFalse(Recipe.objects.exists())
+        self.assertNoImages()
+
+    def test_images_removed_on_save_error(self):
+        save = default_storage.save
+        calls = []
+
+        def failing_save(name, content, **kwargs):
+            calls.append(name)
+            if len(calls) == 2:
+                raise OSError('Нет места на диске')
+            return save(name, content, **kwargs)
+
+        with mock.patch.object(
+            default_storage, 'save', failing_save
+        ), self.assertRaises(OSError):
+            self.import_recipes([
+                self.make_recipe(name, image=make_data_url(make_png()))
+                for name in ('Блины', 'Хлеб')
+            ])
+        self.assertNoImages()
+
+    def test_invalid_image_is_skipped(self):
+        output = self.import_recipes([
+            self.make_recipe('Битая', image=make_data_url(b'not a png')),
+            self.make_recipe('Блины', image=make_data_url(make_png()).replace(
+                'base64,', 'base64,\n'
+            )),
+        ])
+        self.assertIn("Рецепт 'Битая' пропущен", output)
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.name, 'Блины')
+        self.assertEqual(recipe.image.read(), make_png())
+
+    @skipUnless(
+        connection.features.can_return_rows_from_bulk_insert,
+        'Рецепты вставляются через save() и сигналы'
+    )
+    def test_bulk_insert_schedules_renditions(self):
+        with mock.patch(
+            'api.management.commands.import_recipes.schedule_renditions'
+        ) as schedule_renditions:
+            self.import_recipes([
+                self.make_recipe(name, image=make_data_url(make_png()))
+                for name in ('Блины', 'Хлеб')
+            ])
+        self.assertEqual(schedule_renditions.call_count, 2)
+
+
+@override_settings(FEED_BACKFILL_SIZE=3, FEED_FANOUT_MAX_FOLLOWERS=0)
+class FeedTest(APITestCase):
+    """Лента заполняется при записи целиком, чтение ничего не пишет."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user('viewer')
+        cls.authors = [create_user(f'author{index}') for index in range(2)]
+        cls.now = timezone.now()
+        # Рецепты авторов чередуются по дате, у каждого их больше порции.
+        for minutes in range(1, 15):
+            cls.create_recipe(cls.authors[minutes % 2], minutes)
+
+    @classmethod
+    def create_recipe(cls, author, minutes):
+        return Recipe.objects.create(
+            author=author, name=f'Рецепт {minutes}', text='Текст',
+            cooking_time=5, image='recipes/image.jpg',
+            pub_date=cls.now - timedelta(minutes=minutes),
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+        for author in self.authors:
+            Follow.objects.create(user=self.viewer, following=author)
+
+    def read_feed(self):
+        recipe_ids = []
+        url = '/api/recipes/feed/?limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            recipe_ids.extend(recipe['id'] for recipe in response.data[
+                'results'
+            ])
+            url = response.data['next']
+        return recipe_ids
+
+    def assertFeedComplete(self):
+        self.assertEqual(self.read_feed(), list(
+            Recipe.objects.order_by('-pub_date').values_list('id', flat=True)
+        ))
+
+    def test_follow_adds_all_recipes(self):
+        self.assertFeedComplete()
+
+    def test_new_recipe_of_popular_author(self):
+        with mock.patch('api.images.submit_renditions'), \
+                self.captureOnCommitCallbacks(execute=True):
+            for minutes in range(-5, 0):
+                self.create_recipe(self.authors[0], minutes)
+        self.assertFeedComplete()
+
+    def test_read_does_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.read_feed()
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if not query['sql'].lstrip().upper().startswith('SELECT')
+        ])
+
+
+class RecipeImageTest(APITransactionTestCase):
+    """Создание рецепта с картинкой, коммиты идут как в настоящем запросе."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        self.author = create_user('author')
+        self.tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        self.client.force_authenticate(self.author)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Проверка для SQLite')
+    def test_create_with_image(self):
+        # Запись из потока пула конкурирует с запросом за блокировку БД.
+        with mock.patch('api.images.get_executor') as get_executor:
+            response = self.client.post('/api/recipes/', {
+                'name': 'Блины', 'text': 'Текст', 'cooking_time': 10,
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 200}],
+                'image': make_data_url(make_png()),
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        get_executor.assert_not_called()
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            set(recipe.image_renditions),
+            {IMAGE_SOURCE_KEY, *IMAGE_RENDITIONS},
+        )
+
+
+class DecodeDataUrlTest(SimpleTestCase):
+
+    def test_line_breaks(self):
+        content = make_png((300, 200))
+        encoded = base64.encodebytes(content).decode()
+        for data in (
+            encoded, encoded.replace('\n', '\r\n'), f' {encoded}\t',
+        ):
+            with self.subTest(data=data[:10]):
+                file = decode_data_url(f'data:image/png;base64,{data}')
+                self.assertEqual(file.read(), content)
+                self.assertEqual(file.size, len(content))
+
+
+class RenditionsRepresentationTest(APITestCase):
+    """Готовые рендишены сразу видны в кешированном представлении."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        self.name = default_storage.save(
+            'recipe/images/image.png', ContentFile(make_png())
+        )
+        # Рендишены считаются актуальными, поэтому сигналы их не создают.
+        self.author = create_user('author')
+        self.author.avatar = self.name
+        self.author.avatar_renditions = {IMAGE_SOURCE_KEY: self.name}
+        self.author.save()
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Блины', text='Текст', cooking_time=5,
+            image=self.name, image_renditions={IMAGE_SOURCE_KEY: self.name},
+        )
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def assertRenditions(self, model, pk, field_name, get_renditions):
+        self.assertEqual(get_renditions(self.client.get(self.url).data), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(
+                generate_renditions(model, pk, field_name, self.name), 1
+            )
+        self.assertEqual(
+            set(get_renditions(self.client.get(self.url).data)),
+            set(IMAGE_RENDITIONS),
+        )
+
+    def test_recipe_image(self):
+        self.assertRenditions(
+            Recipe, self.recipe.pk, 'image',
+            lambda data: data['image_renditions'],
+        )
+
+    def test_author_avatar(self):
+        self.assertRenditions(
+            User, self.author.pk, 'avatar',
+            lambda data: data['author']['avatar_renditions'],
+        )
+
+
+@skipUnless(orjson, 'orjson не установлен')
+class FastJSONRendererTest(APITestCase):
+
+    def assertSameOutput(self, data):
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+
+    def test_float_differences(self):
+        """Известные отличия от stdlib json, из-за них округляем float."""
+        self.assertEqual(
+            FastJSONRenderer().render([1e16, 1e-7]), b'[1e16,1e-7]'
+        )
+        self.assertEqual(
+            JSONRenderer().render([1e16, 1e-7]), b'[1e+16,1e-07]'
+        )
+        self.assertEqual(
+            FastJSONRenderer().render([float('nan'), float('inf')]),
+            b'[null,null]'
+        )
+        with self.assertRaises(ValueError):
+            JSONRenderer().render([float('nan')])
+
+    def test_coverage_values(self):
+        self.assertSameOutput([
+            round(hits / size, COOKABLE_COVERAGE_DIGITS)
+            for size in range(1, 20001, 7)
+            for hits in (0, 1, size // 3, size - 1, size)
+        ])
+
+    def test_cookable_response(self):
+        cache.clear()
+        author = create_user('author')
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(3)
+        ]
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/image.jpg',
+        )
+        for ingredient in ingredients:
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=10
+            )
+        response = self.client.get(
+            f'/api/recipes/cookable/?ingredients={ingredients[0].pk}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['coverage'], 0.3333)
+        self.assertSameOutput(response.data)
+
+
+class CursorPaginationTest(APITestCase):
+    """Курсор — ключ по всем полям сортировки, а не смещение."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        now = timezone.now()
+        # Одинаковые даты и счётчики: порядок держится только на id.
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.author, name=f'Рецепт {index}', text='Текст',
+                cooking_time=5, image='recipes/image.jpg',
+                pub_date=now - timedelta(minutes=index // 4),
+                favorites_count=index % 3,
+            )
+            for index in range(14)
+        )
+
+    def read_pages(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([recipe['id'] for recipe in response.data[
+                'results'
+            ]])
+            url = response.data['next']
+        return pages
+
+    def assertPages(self, query, ordering):
+        pages = self.read_pages(f'/api/recipes/?cursor=&limit=4{query}')
+        expected = list(
+            Recipe.objects.order_by(*ordering).values_list('id', flat=True)
+        )
+        self.assertEqual(sum(pages, []), expected)
+        return pages
+
+    def test_default_ordering(self):
+        self.assertPages('', ('-pub_date', '-id'))
+
+    def test_requested_ordering(self):
+        self.assertPages(
+            '&ordering=-popularity', ('-favorites_count', '-pub_date', '-id')
+        )
+        self.assertPages('&ordering=pub_date', ('pub_date', 'id'))
+        self.assertPages(
+            '&ordering=popularity', ('favorites_count', 'pub_date', 'id')
+        )
+
+    def test_page_number_ordering_is_stable(self):
+        for ordering in ('-popularity', 'popularity', '-pub_date'):
+            ids = []
+            for page in range(1, 5):
+                response = self.client.get(
+                    f'/api/recipes/?page={page}&limit=4&ordering={ordering}'
+                )
+                ids += [recipe['id'] for recipe in response.data['results']]
+            self.assertEqual(sorted(ids), sorted(
+                Recipe.objects.values_list('id', flat=True)
+            ))
+
+    def test_previous_page(self):
+        first = self.client.get('/api/recipes/?cursor=&limit=4').data
+        second = self.client.get(first['next']).data
+        self.assertEqual(
+            self.client.get(second['previous']).data['results'],
+            first['results'],
+        )
+
+    def test_cursor_of_other_ordering(self):
+        response = self.client.get('/api/recipes/?cursor=&limit=4')
+        response = self.client.get(
+            response.data['next'] + '&ordering=-popularity'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(connection.vendor != 'postgresql', 'Индекс поиска без PostgreSQL')
+class RecipeSearchIndexTest(APITestCase):
+    """Поиск в памяти: лимит после фильтров, изменения без перестройки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [create_user(f'author{index}') for index in range(2)]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.authors[index < 2], name=f'Суп {index}',
+                text='Текст', cooking_time=5, image='recipes/image.jpg',
+            )
+            for index in range(6)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_limit_after_filters(self):
+        with mock.patch('api.search.RECIPE_SEARCH_LIMIT', 2):
+            response = self.client.get('/api/recipes/', {
+                'search': 'суп', 'author': self.authors[1].pk,
+            })
+        self.assertEqual(
+            {recipe['id'] for recipe in response.data['results']},
+            {recipe.pk for recipe in self.recipes[:2]},
+        )
+
+    def test_incremental_refresh(self):
+        self.assertEqual(recipe_index.search('суп'), [
+            recipe.pk for recipe in reversed(self.recipes)
+        ])
+        recipe = self.recipes[0]
+        recipe.name = 'Каша'
+        with mock.patch('api.images.submit_renditions'), \
+                self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        with mock.patch.object(recipe_index, '_build') as build:
+            self.assertEqual(recipe_index.search('каша'), [recipe.pk])
+            self.assertNotIn(recipe.pk, recipe_index.search('суп'))
+        build.assert_not_called()
+
+
+class VersionedCacheTest(APITestCase):
+
+    def test_vary_on_cached_responses(self):
+        cache.clear()
+        Tag.objects.create(name='Обед', slug='lunch')
+        fresh = self.client.get('/api/tags/')
+        self.assertIn('Accept', fresh['Vary'])
+        cached = self.client.get('/api/tags/')
+        not_modified = self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=fresh['ETag']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        for response in (cached, not_modified):
+            self.assertEqual(response['Vary'], fresh['Vary'])
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='')
+class MetricsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        _known_views.clear()
+
+    def test_disabled_without_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 404)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(
+                self.client.get('/api/metrics/').status_code, 404
+            )
+            response = self.client.get(
+                '/api/metrics/', HTTP_AUTHORIZATION='Bearer secret'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('view="metrics"', response.content.decode())
+
+    def test_counters_survive_eviction(self):
+        record('tags', {'requests': 1})
+        cache.delete(METRICS_KEY.format(view='tags', field='requests'))
+        record('tags', {'requests': 1})
+        record('ingredients', {'requests': 2})
+        text = export()
+        self.assertIn('foodgram_requests_total{view="tags"} 1\n', text)
+        self.assertIn('foodgram_requests_total{view="ingredients"} 2\n', text)
+
+    def test_cache_errors_do_not_fail_requests(self):
+        with mock.patch('api.metrics.cache.incr', side_effect=OSError), \
+                self.assertLogs('api.metrics', 'ERROR'):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+
+
+class ChangeLogTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.log = ChangeLog('test_changes', 10)
+
+    def test_changes_since(self):
+        version = self.log.get_version()
+        self.log.record(1)
+        self.log.record(2)
+        self.assertEqual(
+            self.log.changes_since(version, self.log.get_version()), {1, 2}
+        )
+
+    def test_colliding_numbers_force_rebuild(self):
+        # incr без атомарности: оба процесса получили один номер.
+        version = self.log.get_version()
+        with mock.patch('api.cache.cache.incr', return_value=version + 1):
+            self.log.record(1)
+            self.log.record(2)
+        self.assertIsNone(
+            self.log.changes_since(version, self.log.get_version())
+        )
+
+
+class ImportIngredientsTest(APITestCase):
+
+    def import_ingredients(self, content, extension):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, f'ingredients.{extension}')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        stdout = StringIO()
+        call_command('import_ingredients', path, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_short_csv_row(self):
+        output = self.import_ingredients(
+            'name,measurement_unit\nМука,г\nСоль\nМолоко,мл\n', 'csv'
+        )
+        self.assertIn('Запись 2 пропущена', output)
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', flat=True)),
+            {'Мука', 'Молоко'},
+        )
+
+    def test_json_without_field(self):
+        output = self.import_ingredients(
+            '[{"name": "Мука", "measurement_unit": "г"}, {"name": "Соль"}]',
+            'json',
+        )
+        self.assertIn('Запись 2 пропущена', output)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_malformed_json_array(self):
+        file = StringIO('[{"name": "Мука"}, {"name": ' + 'x' * 1000 + ']')
+        with self.assertRaisesMessage(CommandError, 'Некорректный JSON'):
+            list(iter_json_array(file, chunk_size=16, max_record_size=100))
+        self.assertLess(file.tell(), 200)
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views import (IngredientViewSet, RecipeViewSet,
-                       TagViewSet, UserViewSet)
+                       TagViewSet, UserViewSet, metrics_view)
 
 router_v1 = DefaultRouter()
 
@@ -33,6 +33,7 @@ router_v1.register(
 urlpatterns = [
 
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router_v1.urls)),
 
 ]
@@ -1,63 +1,284 @@
-import base64
-from io import BytesIO
+import csv
+import logging
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
 
-from recipe.models import IngredientRecipe, ShoppingCart
+from recipe.models import ShoppingCart, ShoppingListItem
+from .cache import get_version
+from .constants import (DATA_URL_PREFIX, IMAGE_SOURCE_KEY,
+                        SHOPPING_CART_VERSION, SHOPPING_LIST_CACHE_KEY,
+                        SHOPPING_LIST_CHUNK_SIZE, SHOPPING_LIST_FILENAME,
+                        SHOPPING_LIST_VERSION)
+from .images import decode_data_url
+
+logger = logging.getLogger(__name__)
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+
+def parse_recipes_limit(request):
+    """Возвращает recipes_limit из запроса или None, если он не задан."""
+    limit = request.query_params.get('recipes_limit')
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+def get_file_url(name, storage=default_storage):
+    """storage.url(name) без urljoin для FileSystemStorage.
+
+    filepath_to_uri экранирует ':', '?', '#' и ';', поэтому urljoin
+    с base_url сводится к склейке, пока в пути нет пустых сегментов
+    и сегментов '.' и '..'; их разбирает сам storage.url.
+    """
+    if isinstance(storage, FileSystemStorage) and storage.base_url:
+        path = filepath_to_uri(name).lstrip('/')
+        if '/.' not in '/' + path and '//' not in path:
+            return storage.base_url + path
+    return storage.url(name)
 
 
 class Base64ImageField(serializers.ImageField):
     """Конвертируем строку Base64 в изображение."""
 
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        if isinstance(data, str) and data.startswith(DATA_URL_PREFIX):
+            data = decode_data_url(data)
 
         return super().to_internal_value(data)
 
 
-class ShoppingCartDownloader:
-    """Класс для создания файла с ингредиентами и его скачивания."""
+class ImageRenditionsField(serializers.Field):
+    """URL уменьшенных копий изображения: {рендишен: {формат: url}}.
+
+    Пока рендишены для текущего файла не готовы, отдаёт None, и клиент
+    показывает оригинал.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        return self.get_urls(
+            getattr(obj, self.image_field).name,
+            getattr(obj, f'{self.image_field}_renditions'),
+            self.context.get('request'),
+        )
+
+    @classmethod
+    def get_urls(cls, name, renditions, request=None):
+        """Представление по имени файла и JSON рендишенов из модели."""
+        if not name or renditions.get(IMAGE_SOURCE_KEY) != name:
+            return None
+        return {
+            rendition: {
+                image_format: cls._build_url(request, file_name)
+                for image_format, file_name in formats.items()
+            }
+            for rendition, formats in renditions.items()
+            if rendition != IMAGE_SOURCE_KEY
+        }
 
     @staticmethod
-    def download_shopping_list(request):
-
-        ingredient_data = (
-            IngredientRecipe.objects
-            .filter(recipe__shopping_recipe__user=request.user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-            .order_by()  # так как в Meta модели прописан ordering
+    def _build_url(request, name):
+        url = get_file_url(name)
+        return request.build_absolute_uri(url) if request else url
+
+
+class _Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartDownloader:
+    """Класс для создания файла с ингредиентами и его скачивания.
+
+    Строки пишутся в ответ прямо из курсора ShoppingListItem, поэтому память
+    не зависит от размера корзины. Готовый файл кешируется до изменения
+    корзины пользователя или состава рецептов.
+    """
+
+    content_types = {
+        'txt': 'text/plain; charset=utf-8',
+        'csv': 'text/csv; charset=utf-8',
+        'pdf': 'application/pdf',
+    }
+    pdf_font_name = 'ShoppingListFont'
+
+    @classmethod
+    def is_supported(cls, file_format):
+        return file_format in cls.content_types and (
+            file_format != 'pdf' or cls._register_pdf_font()
+        )
+
+    @classmethod
+    def _register_pdf_font(cls):
+        """Регистрирует шрифт PDF до ответа: после заголовков поток
+        уже не может упасть с понятной ошибкой."""
+        if canvas is None:
+            return False
+        if cls.pdf_font_name in pdfmetrics.getRegisteredFontNames():
+            return True
+        try:
+            pdfmetrics.registerFont(
+                TTFont(cls.pdf_font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        except Exception:
+            logger.exception(
+                'Не удалось загрузить шрифт %s',
+                settings.SHOPPING_LIST_PDF_FONT
+            )
+            return False
+        return True
+
+    @classmethod
+    def download_shopping_list(cls, request, file_format='txt'):
+        user = request.user
+        cache_key = SHOPPING_LIST_CACHE_KEY.format(
+            user=user.pk,
+            format=file_format,
+            list=get_version(SHOPPING_LIST_VERSION),
+            cart=get_version(SHOPPING_CART_VERSION.format(user.pk)),
         )
+        content = cache.get(cache_key)
 
-        recipes_amount = ShoppingCart.objects.filter(user=request.user).count()
+        if content is not None:
+            response = HttpResponse(
+                content, content_type=cls.content_types[file_format]
+            )
+        else:
+            chunks = getattr(cls, f'_render_{file_format}')(user)
+            response = StreamingHttpResponse(
+                cls._cache_chunks(cache_key, chunks),
+                content_type=cls.content_types[file_format]
+            )
 
-        head = [
-            f'Список покупок {request.user.username}\n\n',
-            f'Количество рецептов в списке: {(recipes_amount)}\n\n',
-            'Список ингредиентов к покупке:\n\n',
-        ]
+        response['Content-Disposition'] = (
+            f'attachment; filename="{SHOPPING_LIST_FILENAME}.{file_format}"'
+        )
+        return response
 
-        shop_list = []
+    @staticmethod
+    def _cache_chunks(cache_key, chunks):
+        """Отдаёт чанки клиенту и кеширует файл, если он не слишком велик."""
+        max_size = settings.SHOPPING_LIST_CACHE_MAX_SIZE
+        parts, size = [], 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size > max_size:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
 
-        for item in ingredient_data:
+        if parts is not None:
+            cache.set(
+                cache_key, b''.join(parts),
+                settings.SHOPPING_LIST_CACHE_TIMEOUT
+            )
+
+    @staticmethod
+    def _get_ingredients(user):
+        return (
+            ShoppingListItem.objects
+            .filter(user=user)
+            .values(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'total_amount'
+            )
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        )
+
+    @staticmethod
+    def _get_head(user):
+        recipes_amount = ShoppingCart.objects.filter(user=user).count()
+        return (
+            f'Список покупок {user.username}',
+            f'Количество рецептов в списке: {recipes_amount}',
+            'Список ингредиентов к покупке:',
+        )
+
+    @classmethod
+    def _render_txt(cls, user):
+        yield ''.join(f'{line}\n\n' for line in cls._get_head(user)).encode()
+
+        for item in cls._get_ingredients(user):
             name = item['ingredient__name']
             unit = item['ingredient__measurement_unit']
             amount = item['total_amount']
-            shop_list.append(f'{name} - {amount} {unit} \n')
+            yield f'{name} - {amount} {unit} \n'.encode()
 
-        response = ''.join(head + shop_list)
-        byte_response = BytesIO(response.encode('utf-8'))
+    @classmethod
+    def _render_csv(cls, user):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        ).encode()
 
-        return FileResponse(
-            byte_response,
-            as_attachment=True,
-            filename='Shopping_list.txt',
-            content_type='text/plain'
-        )
+        for item in cls._get_ingredients(user):
+            yield writer.writerow((
+                item['ingredient__name'],
+                item['total_amount'],
+                item['ingredient__measurement_unit'],
+            )).encode()
+
+    @classmethod
+    def _render_pdf(cls, user):
+        """PDF собирается во временный файл и отдаётся чанками.
+
+        Таблица смещений PDF пишется в конце файла, поэтому отдавать его
+        прямо в сокет нельзя; SpooledTemporaryFile держит в памяти только
+        небольшие файлы. Шрифт регистрирует is_supported.
+        """
+        with SpooledTemporaryFile(
+            max_size=settings.SHOPPING_LIST_CACHE_MAX_SIZE
+        ) as file:
+            pdf = canvas.Canvas(file, pagesize=A4)
+            width, height = A4
+            margin, line_height, font_size = 50, 18, 12
+            y = height - margin
+
+            def write_line(text):
+                nonlocal y
+                if y < margin:
+                    pdf.showPage()
+                    y = height - margin
+                pdf.setFont(cls.pdf_font_name, font_size)
+                pdf.drawString(margin, y, text)
+                y -= line_height
+
+            for line in cls._get_head(user):
+                write_line(line)
+                y -= line_height
+
+            for item in cls._get_ingredients(user):
+                write_line(
+                    f'{item["ingredient__name"]} - {item["total_amount"]} '
+                    f'{item["ingredient__measurement_unit"]}'
+                )
+
+            pdf.save()
+            file.seek(0)
+            while chunk := file.read(SHOPPING_LIST_CHUNK_SIZE * 32):
+                yield chunk
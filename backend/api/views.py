@@ -1,6 +1,12 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.db.models import BooleanField, Count, F, Prefetch, Value
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views as djoser_views
 from rest_framework import status, viewsets
@@ -9,25 +15,37 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
 
-from recipe.models import (Favorite, Ingredient, Recipe,
-                           ShoppingCart, Tag)
+from recipe.models import (Favorite, FeedItem, Ingredient, Recipe,
+                           ShoppingCart, ShoppingListItem, Tag)
 from users.models import Follow
+from .cache import get_tag_ids, short_link_cache
+from .constants import (INGREDIENT_LIMIT_PARAM, INGREDIENT_SEARCH_PARAM,
+                        INGREDIENTS_VERSION, TAGS_MODE_ALL, TAGS_VERSION)
 from .filters import RecipeFilter, IngredientFilter
-from .paginators import FoodgramPagination
+from .metrics import export as export_metrics
+from .mixins import CompiledReadMixin, VersionedCacheMixin
+from .paginators import FoodgramCursorPagination, FoodgramPagination
 from .permissions import AuthorOrReadOnly
-from .serializers import (AvatarSerializer, FavoriteSerializer,
+from .renderers import (FastJSONRenderer, ShoppingListCsvRenderer,
+                        ShoppingListPdfRenderer, ShoppingListTxtRenderer)
+from .search import cookable_index, ingredient_index
+from .serializers import (AvatarSerializer, CookableQuerySerializer,
+                          CookableRecipeSerializer, FavoriteSerializer,
                           FollowSerializer, IngredientSerializer,
                           RecipeCreateUpdateSerializer, RecipeReadSerializer,
                           SubscriptionsSerializer, TagSerializer,
-                          UserSerializer, ShoppingCartSerializer)
+                          UserSerializer, ShoppingCartSerializer,
+                          compiled_ingredients, compiled_short_recipes,
+                          compiled_tags)
 
-from .utils import ShoppingCartDownloader
+from .utils import ShoppingCartDownloader, parse_recipes_limit
 
 User = get_user_model()
 
 
 class UserViewSet(djoser_views.UserViewSet):
     pagination_class = FoodgramPagination
+    cursor_ordering = ('username', 'id')
     queryset = User.objects.all()
 
     def get_serializer_class(self):
@@ -108,27 +126,65 @@ class UserViewSet(djoser_views.UserViewSet):
         pagination_class=FoodgramPagination
     )
     def subscriptions(self, request, id=None):
-        queryset = User.objects.filter(following__user=request.user)
+        queryset = (
+            User.objects.filter(following__user=request.user)
+            .annotate(
+                recipes_count=Count('recipes', distinct=True),
+                is_subscribed=Value(True, output_field=BooleanField()),
+            )
+            .order_by('username')
+        )
         pages = self.paginate_queryset(queryset)
+        # Превью рецептов одним запросом строками .values() вместо
+        # prefetch_related, который собирал бы объекты модели.
+        previews = defaultdict(list)
+        for row in Recipe.objects.latest_per_author(
+            parse_recipes_limit(request)
+        ).filter(author__in=pages).values(
+            'author_id', *compiled_short_recipes.values
+        ):
+            previews[row['author_id']].append(row)
+        for user in pages:
+            user.recipes_preview = previews[user.pk]
         serializer = SubscriptionsSerializer(
             pages, many=True, context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(VersionedCacheMixin, CompiledReadMixin,
+                 viewsets.ReadOnlyModelViewSet):
+    cache_version = TAGS_VERSION
     serializer_class = TagSerializer
+    compiled_serializer = compiled_tags
     queryset = Tag.objects.all()
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, CompiledReadMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    cache_version = INGREDIENTS_VERSION
     serializer_class = IngredientSerializer
+    compiled_serializer = compiled_ingredients
     queryset = Ingredient.objects.all()
     pagination_class = None
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        return self._cached(self._search, request, *args, **kwargs)
+
+    def _search(self, request, *args, **kwargs):
+        """Автодополнение из индекса в памяти вместо istartswith в БД."""
+        try:
+            limit = int(request.query_params[INGREDIENT_LIMIT_PARAM])
+        except (KeyError, ValueError):
+            limit = None
+        return Response(ingredient_index.search(
+            request.query_params.get(INGREDIENT_SEARCH_PARAM, ''),
+            limit if limit and limit > 0 else None,
+        ))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     serializer_class = RecipeReadSerializer
@@ -139,6 +195,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_viewer_flags(self.request.user)
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update']:
             return RecipeCreateUpdateSerializer
@@ -151,6 +213,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated, ),
         url_path='favorite',
     )
+    @transaction.atomic
     def favorite(self, request, pk):
         recipe = get_object_or_404(Recipe, id=pk)
 
@@ -158,13 +221,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = FavoriteSerializer(data=data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=F('favorites_count') + 1
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
+    @transaction.atomic
     def delete_favorite(self, request, pk):
+        recipe = get_object_or_404(Recipe, id=pk)
         deleted, _ = Favorite.objects.filter(
             user=request.user,
-            recipe=get_object_or_404(Recipe, id=pk)
+            recipe=recipe
         ).delete()
 
         if not deleted:
@@ -173,6 +241,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=F('favorites_count') - 1
+        )
+
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -181,6 +253,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated, ),
         url_path='shopping_cart',
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         recipe = get_object_or_404(Recipe, id=pk)
 
@@ -188,14 +261,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = ShoppingCartSerializer(data=data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        ShoppingListItem.objects.add_recipe(request.user, recipe)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            carts_count=F('carts_count') + 1
+        )
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def delete_shopping_cart(self, request, pk):
+        recipe = get_object_or_404(Recipe, id=pk)
         deleted, _ = ShoppingCart.objects.filter(
             user=request.user,
-            recipe=get_object_or_404(Recipe, id=pk)
+            recipe=recipe
         ).delete()
 
         if not deleted:
@@ -204,15 +283,103 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        ShoppingListItem.objects.remove_recipe(request.user, recipe)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            carts_count=F('carts_count') - 1
+        )
+
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=(IsAuthenticated, )
+        permission_classes=(IsAuthenticated, ),
+        renderer_classes=(
+            FastJSONRenderer, ShoppingListTxtRenderer,
+            ShoppingListCsvRenderer, ShoppingListPdfRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        return ShoppingCartDownloader.download_shopping_list(request)
+        file_format = request.accepted_renderer.format
+        if file_format == 'json':
+            file_format = 'txt'
+
+        if not ShoppingCartDownloader.is_supported(file_format):
+            return Response(
+                {'detail': f'Формат {file_format} недоступен.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return ShoppingCartDownloader.download_shopping_list(
+            request, file_format
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated, ),
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сверху.
+
+        Лента читается диапазоном по индексу (user, pub_date, id) таблицы
+        FeedItem с курсорной пагинацией. Таблица заполняется при
+        публикации рецептов и при подписке, чтение ничего не пишет.
+        """
+        queryset = FeedItem.objects.filter(user=request.user).prefetch_related(
+            Prefetch(
+                'recipe',
+                Recipe.objects.with_viewer_flags(request.user)
+            )
+        )
+        paginator = FoodgramCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = RecipeReadSerializer(
+            [item.recipe for item in page],
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(AllowAny, ),
+    )
+    def cookable(self, request):
+        """Рецепты по доле ингредиентов, которые есть у пользователя.
+
+        ?ingredients=1&ingredients=2 — имеющиеся ингредиенты, limit — размер
+        топа, tags и tags_mode — как в списке рецептов. Ранжирование идёт
+        по индексу в памяти без GROUP BY по таблице ингредиентов рецептов.
+        """
+        query = CookableQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        match_all = params['tags_mode'] == TAGS_MODE_ALL
+        tag_ids = None
+        if params.get('tags'):
+            tag_ids = get_tag_ids(params['tags'], match_all)
+            if not tag_ids:
+                return Response([])
+
+        matches = cookable_index.search(
+            params['ingredients'], params['limit'], tag_ids, match_all
+        )
+        recipes = Recipe.objects.with_viewer_flags(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        result = []
+        for recipe_id, coverage, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.coverage, recipe.missing = coverage, missing
+                result.append(recipe)
+        serializer = CookableRecipeSerializer(
+            result, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
 
     @action(
         detail=True,
@@ -229,8 +396,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
 
 def short_link_view_redirect(request, short_code):
-    recipe = get_object_or_404(Recipe, short_link=short_code)
+    recipe_id = short_link_cache.resolve(short_code)
+    if recipe_id is None:
+        raise Http404('Рецепт не найден.')
 
     return HttpResponseRedirect(
-        request.build_absolute_uri(f'/recipes/{recipe.id}/')
+        request.build_absolute_uri(f'/recipes/{recipe_id}/')
+    )
+
+
+def metrics_view(request):
+    """Счётчики MetricsMiddleware в текстовом формате Prometheus.
+
+    Отдаются только с заголовком Authorization: Bearer <METRICS_TOKEN>;
+    без заданного токена адрес недоступен.
+    """
+    token = settings.METRICS_TOKEN
+    if not settings.METRICS_ENABLED or not token or not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        raise Http404
+    return HttpResponse(
+        export_metrics(), content_type='text/plain; version=0.0.4'
     )
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -125,13 +126,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.User'
 
 
+FAST_JSON = os.getenv('FAST_JSON', 'True').lower() in ['true']
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer' if FAST_JSON
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser' if FAST_JSON
+        else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': PAGINATION_PAGE_SIZE,
@@ -141,6 +155,99 @@ REST_FRAMEWORK = {
 DEFAULT_AVATAR = 'users/default.jpg'
 
 
+# Версии, журналы изменений и счётчики метрик должны быть общими для
+# всех воркеров: кеш в памяти процесса годится только для разработки.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    'django.core.cache.backends.locmem.LocMemCache' if DEBUG
+    else 'django.core.cache.backends.filebased.FileBasedCache'
+)
+
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 100000))
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', '' if DEBUG else '/tmp/foodgram_cache'
+        ),
+    }
+}
+
+if CACHE_BACKEND.startswith('django.core.cache.backends.') and (
+    'memcached' not in CACHE_BACKEND
+):
+    # Memcached передаёт OPTIONS клиенту и вытесняет ключи сам.
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': CACHE_MAX_ENTRIES}
+
+
+REFERENCE_CACHE_TIMEOUT = int(
+    os.getenv('REFERENCE_CACHE_TIMEOUT', 24 * 60 * 60)
+)
+
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 60))
+
+SHORT_LINK_TIMEOUT = int(os.getenv('SHORT_LINK_TIMEOUT', 7 * 24 * 60 * 60))
+
+SHORT_LINK_NEGATIVE_TIMEOUT = int(
+    os.getenv('SHORT_LINK_NEGATIVE_TIMEOUT', 5 * 60)
+)
+
+SHORT_LINK_LOCAL_CACHE_SIZE = int(
+    os.getenv('SHORT_LINK_LOCAL_CACHE_SIZE', 10000)
+)
+
+SHORT_LINK_LOCAL_CACHE_TIMEOUT = int(
+    os.getenv('SHORT_LINK_LOCAL_CACHE_TIMEOUT', 60)
+)
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 60))
+
+RECIPE_REPRESENTATION_TIMEOUT = int(
+    os.getenv('RECIPE_REPRESENTATION_TIMEOUT', 24 * 60 * 60)
+)
+
+SHOPPING_LIST_CACHE_MAX_SIZE = int(
+    os.getenv('SHOPPING_LIST_CACHE_MAX_SIZE', 1024 * 1024)
+)
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 60 * 60)
+)
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 6000))
+
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 24_000_000))
+
+IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('IMAGE_MAX_UPLOAD_SIZE', 7 * 1024 * 1024)
+)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() in ['true']
+
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 1.0))
+
+METRICS_REPEATED_QUERIES = int(os.getenv('METRICS_REPEATED_QUERIES', 5))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+CHANGE_LOG_TIMEOUT = int(os.getenv('CHANGE_LOG_TIMEOUT', 24 * 60 * 60))
+
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+
+FEED_FANOUT_BATCH_SIZE = int(os.getenv('FEED_FANOUT_BATCH_SIZE', 1000))
+
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
@@ -1,8 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
 from api.constants import ING_INLINE_MIN_VALUE
 
 
@@ -19,16 +20,35 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class ShoppingListAdminMixin:
+    """Переносит правки ингредиентов рецептов в агрегат списка покупок."""
+
+    @staticmethod
+    def _get_amounts(recipe_ids):
+        return {
+            recipe_id: dict(
+                IngredientRecipe.objects.filter(recipe_id=recipe_id)
+                .values_list('ingredient_id', 'amount')
+            )
+            for recipe_id in recipe_ids if recipe_id is not None
+        }
+
+    @staticmethod
+    def _change_recipes(old_amounts):
+        for recipe_id, amounts in old_amounts.items():
+            ShoppingListItem.objects.change_recipe(recipe_id, amounts)
+
+
 class IngredientRecipeInline(admin.TabularInline):
     model = IngredientRecipe
     min_num = ING_INLINE_MIN_VALUE
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ShoppingListAdminMixin, admin.ModelAdmin):
     list_display = (
         'name', 'author', 'cooking_time',
-        'pub_date', 'get_favorite_count',
+        'pub_date', 'get_favorite_count', 'carts_count',
         'short_link', 'display_image'
     )
     search_fields = ('name', 'author__username')
@@ -37,8 +57,9 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientRecipeInline, )
 
     def get_favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
     get_favorite_count.short_description = 'Количество добавлений в избранное'
+    get_favorite_count.admin_order_field = 'favorites_count'
 
     def display_image(self, obj):
         if obj.image:
@@ -49,25 +70,90 @@ class RecipeAdmin(admin.ModelAdmin):
         return 'Нет изображения'
     display_image.short_description = 'Изображение'
 
-    def save_model(self, request, obj, form, change):
-        if not change:
-            obj.short_link = obj.create_random_string()
-        super().save_model(request, obj, form, change)
+    def save_related(self, request, form, formsets, change):
+        old_amounts = self._get_amounts((form.instance.pk, ))
+        super().save_related(request, form, formsets, change)
+        self._change_recipes(old_amounts)
 
 
 @admin.register(IngredientRecipe)
-class IngredientRecipeAdmin(admin.ModelAdmin):
+class IngredientRecipeAdmin(ShoppingListAdminMixin, admin.ModelAdmin):
     list_display = ('ingredient', 'recipe', 'amount')
     search_fields = ('ingredient__name', 'recipe__name')
 
+    def save_model(self, request, obj, form, change):
+        old_amounts = self._get_amounts({
+            obj.recipe_id, form.initial.get('recipe') if change else None
+        })
+        super().save_model(request, obj, form, change)
+        self._change_recipes(old_amounts)
+
+    def delete_model(self, request, obj):
+        old_amounts = self._get_amounts((obj.recipe_id, ))
+        super().delete_model(request, obj)
+        self._change_recipes(old_amounts)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        old_amounts = self._get_amounts(
+            set(queryset.values_list('recipe_id', flat=True))
+        )
+        super().delete_queryset(request, queryset)
+        self._change_recipes(old_amounts)
+
+
+class RecipeCountersAdminMixin:
+    """Пересчитывает счётчики рецептов после правок связей в админке."""
+
+    def save_model(self, request, obj, form, change):
+        old_recipe_id = form.initial.get('recipe') if change else None
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(
+            pk__in=(obj.recipe_id, old_recipe_id)
+        ).refresh_counters()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk=obj.recipe_id).refresh_counters()
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipe_ids).refresh_counters()
+
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(RecipeCountersAdminMixin, admin.ModelAdmin):
     list_display = ('recipe', 'user')
     search_fields = ('recipe__name', 'user__username')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(RecipeCountersAdminMixin, admin.ModelAdmin):
+    """Правки корзин сразу применяются к агрегату списка покупок."""
+
     list_display = ('recipe', 'user')
     search_fields = ('recipe__name', 'user__username')
+
+    def save_model(self, request, obj, form, change):
+        old = (
+            ShoppingCart.objects.select_related('user').get(pk=obj.pk)
+            if change else None
+        )
+        super().save_model(request, obj, form, change)
+        if old is not None:
+            if (old.user_id, old.recipe_id) == (obj.user_id, obj.recipe_id):
+                return
+            ShoppingListItem.objects.remove_recipe(old.user, old.recipe_id)
+        ShoppingListItem.objects.add_recipe(obj.user, obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.remove_recipe(obj.user, obj.recipe_id)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        carts = list(queryset.select_related('user'))
+        super().delete_queryset(request, queryset)
+        for cart in carts:
+            ShoppingListItem.objects.remove_recipe(cart.user, cart.recipe_id)
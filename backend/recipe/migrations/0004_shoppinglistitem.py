@@ -0,0 +1,62 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_list(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipe', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipe', 'ShoppingListItem')
+    rows = (
+        IngredientRecipe.objects
+        .filter(recipe__shopping_recipe__isnull=False)
+        .values('recipe__shopping_recipe__user', 'ingredient')
+        .annotate(
+            total_amount=models.Sum('amount'),
+            recipe_count=models.Count('recipe'),
+        )
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['recipe__shopping_recipe__user'],
+                ingredient_id=row['ingredient'],
+                total_amount=row['total_amount'],
+                recipe_count=row['recipe_count'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe', '0003_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Общее количество')),
+                ('recipe_count', models.PositiveIntegerField(verbose_name='Количество рецептов')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipe.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Список покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_list, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+def empty_short_link_to_null(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Recipe.objects.filter(short_link='').update(short_link=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0004_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.CharField(blank=True, max_length=7, null=True, unique=True, verbose_name='Короткая ссылка'),
+        ),
+        migrations.RunPython(
+            empty_short_link_to_null, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:36
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+
+    def count(model_name):
+        model = apps.get_model('recipe', model_name)
+        return Coalesce(
+            models.Subquery(
+                model.objects.filter(recipe=models.OuterRef('pk'))
+                .order_by()
+                .values('recipe')
+                .annotate(count=models.Count('pk'))
+                .values('count')
+            ),
+            0
+        )
+
+    Recipe.objects.update(
+        favorites_count=count('Favorite'),
+        carts_count=count('ShoppingCart'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0005_recipe_short_link_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в корзину'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:43
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('pg_catalog.russian', "
+    "coalesce({row}name, '')), 'A') || "
+    "setweight(to_tsvector('pg_catalog.russian', "
+    "coalesce({row}text, '')), 'B')"
+)
+
+CREATE_SQL = (
+    'CREATE INDEX recipe_search_vector_idx '
+    'ON recipe_recipe USING gin (search_vector)',
+    'CREATE FUNCTION recipe_search_vector_update() RETURNS trigger AS $$ '
+    'BEGIN NEW.search_vector := ' + SEARCH_VECTOR.format(row='NEW.')
+    + '; RETURN NEW; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER recipe_search_vector_trigger '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipe_recipe '
+    'FOR EACH ROW EXECUTE PROCEDURE recipe_search_vector_update()',
+    'UPDATE recipe_recipe SET search_vector = ' + SEARCH_VECTOR.format(row=''),
+)
+
+DROP_SQL = (
+    'DROP TRIGGER IF EXISTS recipe_search_vector_trigger ON recipe_recipe',
+    'DROP FUNCTION IF EXISTS recipe_search_vector_update()',
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+)
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0007_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_on_postgres(CREATE_SQL), run_on_postgres(DROP_SQL)
+        ),
+    ]
@@ -1,15 +1,21 @@
-import random
-import string
+from itertools import islice
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch,
+                              Subquery, Value)
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from api.constants import (RECIPE_NAME_LENGTH, SHORT_LINK_LENGTH,
                            TAG_NAME_LENGTH, TAG_SLUG_LENGTH, AMOUNT_MIN_VALUE,
                            ING_MU_LENGTH, ING_NAME_LENGTH,
-                           COOKING_TIME_MIN_VALUE, INT_FIELD_MAX_VALUE)
+                           COOKING_TIME_MIN_VALUE, INT_FIELD_MAX_VALUE,
+                           SHORT_LINK_ALPHABET, SHORT_LINK_MULTIPLIER)
+from users.models import Follow
 
 User = get_user_model()
 
@@ -67,6 +73,134 @@ class Ingredient(models.Model):
         )
 
 
+def encode_short_link(pk):
+    """Короткий код рецепта из pk без проверок на коллизии.
+
+    pk перемешивается биекциями на [0, 62 ** SHORT_LINK_LENGTH): умножением
+    на взаимно простое число и разворотом цифр между двумя умножениями,
+    поэтому разные pk всегда дают разные коды, а соседние не похожи.
+    Коды длиннее старых случайных шестисимвольных и не пересекаются с ними.
+    """
+    base = len(SHORT_LINK_ALPHABET)
+    modulo = base ** SHORT_LINK_LENGTH
+    value = pk * SHORT_LINK_MULTIPLIER % modulo
+    digits = []
+    for _ in range(SHORT_LINK_LENGTH):
+        value, digit = divmod(value, base)
+        digits.append(digit)
+    for digit in digits:
+        value = value * base + digit
+    value = value * SHORT_LINK_MULTIPLIER % modulo
+
+    code = []
+    for _ in range(SHORT_LINK_LENGTH):
+        value, index = divmod(value, base)
+        code.append(SHORT_LINK_ALPHABET[index])
+    return ''.join(code)
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов для ленты и карточки рецепта."""
+
+    def with_viewer_flags(self, viewer):
+        """Флаги зрителя одним запросом вместе с рецептами.
+
+        Аннотирует is_favorited / is_in_shopping_cart и author_is_subscribed;
+        теги, ингредиенты и автор берутся из кеша представлений
+        (см. RecipeReadSerializer), а для промахов — через with_related.
+        """
+        queryset = self.defer('search_vector')
+        if viewer is None or not viewer.is_authenticated:
+            false = Value(False, output_field=models.BooleanField())
+            return queryset.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false,
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=viewer, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(
+                    user=viewer, recipe=OuterRef('pk')
+                )
+            ),
+            author_is_subscribed=Exists(
+                Follow.objects.filter(
+                    user=viewer, following=OuterRef('author')
+                )
+            ),
+        )
+
+    def with_related(self, viewer):
+        """Подгружает теги, ингредиенты и авторов с is_subscribed."""
+        return self.defer('search_vector').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(viewer),
+            ),
+        )
+
+    def latest_per_author(self, limit=None):
+        """Последние limit рецептов каждого автора.
+
+        Коррелированный подзапрос с LIMIT отбирает рецепты на стороне БД,
+        поэтому превью для страницы авторов грузится одним запросом.
+        """
+        queryset = self.order_by('-pub_date', '-pk')
+        if limit is None:
+            return queryset
+        return queryset.filter(
+            pk__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author'))
+                .order_by('-pub_date', '-pk')
+                .values('pk')[:limit]
+            )
+        )
+
+    def refresh_counters(self):
+        """Пересчитывает favorites_count и carts_count по таблицам связей.
+
+        Используется после массовых удалений, где точечные F()-обновления
+        не выполнялись.
+        """
+        return self.update(
+            favorites_count=self._count_subquery(Favorite),
+            carts_count=self._count_subquery(ShoppingCart),
+        )
+
+    def out_of_sync(self):
+        """Рецепты, чьи счётчики расходятся с таблицами связей."""
+        return self.annotate(
+            expected_favorites_count=self._count_subquery(Favorite),
+            expected_carts_count=self._count_subquery(ShoppingCart),
+        ).exclude(
+            favorites_count=F('expected_favorites_count'),
+            carts_count=F('expected_carts_count'),
+        )
+
+    @staticmethod
+    def _count_subquery(model):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(recipe=OuterRef('pk'))
+                .order_by()
+                .values('recipe')
+                .annotate(count=Count('pk'))
+                .values('count')
+            ),
+            0
+        )
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
 
@@ -86,6 +220,12 @@ class Recipe(models.Model):
         default=None,
         verbose_name='Изображение'
     )
+    image_renditions = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     text = models.TextField(
         verbose_name='Текстовое описание рецепта'
     )
@@ -111,36 +251,64 @@ class Recipe(models.Model):
         default=timezone.now
     )
 
-    short_link = models.CharField(
+    # NULL, а не пустая строка: код выдаётся после вставки по pk,
+    # и несколько рецептов без кода не должны нарушать unique.
+    short_link = models.CharField(  # noqa: DJ01
         max_length=SHORT_LINK_LENGTH,
         verbose_name='Короткая ссылка',
         blank=True,
+        null=True,
         unique=True
     )
 
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в корзину',
+        default=0,
+        editable=False
+    )
+
+    # Заполняется триггером PostgreSQL (см. миграцию 0008),
+    # на SQLite не используется.
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_popularity_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'Рецепт: {self.name}'
 
     def save(self, *args, **kwargs):
-        if not self.pk:
-            unique = False
-            while not unique:
-                self.short_link = self.create_random_string()
-                unique = not Recipe.objects.filter(
-                    short_link=self.short_link
-                ).exists()
         super().save(*args, **kwargs)
-
-    def create_random_string(self):
-        symbols = string.ascii_letters + string.digits
-        return ''.join(
-            random.choice(symbols) for _ in range(SHORT_LINK_LENGTH)
-        )
+        if not self.short_link:
+            # Код выводится из pk и выдаётся после вставки. UPDATE, а не
+            # второй save(): обработчики post_save не срабатывают дважды.
+            self.short_link = encode_short_link(self.pk)
+            Recipe.objects.filter(pk=self.pk).update(
+                short_link=self.short_link
+            )
 
 
 class IngredientRecipe(models.Model):
@@ -250,3 +418,303 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingListManager(models.Manager):
+    """Поддерживает агрегат списка покупок в актуальном состоянии.
+
+    Методы вызываются в той же транзакции, что и изменение корзины или
+    состава рецепта, и применяют к агрегату только разницу.
+    """
+
+    def add_recipe(self, user, recipe):
+        amounts = self._get_amounts(recipe)
+        self._apply((user.pk, ), {
+            ingredient: (amount, 1) for ingredient, amount in amounts.items()
+        })
+
+    def remove_recipe(self, user, recipe):
+        self._remove_recipe((user.pk, ), recipe)
+
+    def remove_recipe_everywhere(self, recipe):
+        self._remove_recipe(self._get_cart_users(recipe), recipe)
+
+    def change_recipe(self, recipe, old_amounts):
+        """Применяет правку ингредиентов рецепта ко всем корзинам с ним."""
+        new_amounts = self._get_amounts(recipe)
+        deltas = {}
+        for ingredient in old_amounts.keys() | new_amounts.keys():
+            delta = (
+                new_amounts.get(ingredient, 0)
+                - old_amounts.get(ingredient, 0),
+                (ingredient in new_amounts) - (ingredient in old_amounts),
+            )
+            if delta != (0, 0):
+                deltas[ingredient] = delta
+        if deltas:
+            self._apply(self._get_cart_users(recipe), deltas)
+
+    def get_expected(self):
+        """Эталонный агрегат, посчитанный по корзинам и рецептам."""
+        return (
+            IngredientRecipe.objects
+            .filter(recipe__shopping_recipe__isnull=False)
+            .values('recipe__shopping_recipe__user', 'ingredient')
+            .annotate(
+                total_amount=models.Sum('amount'),
+                recipe_count=models.Count('recipe'),
+            )
+            .order_by()
+        )
+
+    def rebuild(self, batch_size=None):
+        self.all().delete()
+        return len(self.bulk_create(
+            (
+                self.model(
+                    user_id=row['recipe__shopping_recipe__user'],
+                    ingredient_id=row['ingredient'],
+                    total_amount=row['total_amount'],
+                    recipe_count=row['recipe_count'],
+                )
+                for row in self.get_expected().iterator()
+            ),
+            batch_size=batch_size,
+        ))
+
+    @staticmethod
+    def _get_amounts(recipe):
+        return dict(
+            IngredientRecipe.objects.filter(recipe=recipe)
+            .values_list('ingredient_id', 'amount')
+            .order_by()
+        )
+
+    @staticmethod
+    def _get_cart_users(recipe):
+        return tuple(
+            ShoppingCart.objects.filter(recipe=recipe)
+            .values_list('user_id', flat=True)
+            .order_by()
+        )
+
+    def _remove_recipe(self, user_ids, recipe):
+        amounts = self._get_amounts(recipe)
+        self._apply(user_ids, {
+            ingredient: (-amount, -1)
+            for ingredient, amount in amounts.items()
+        })
+
+    def _apply(self, user_ids, deltas):
+        """Прибавляет deltas {ingredient_id: (amount, recipe_count)}.
+
+        select_for_update не блокирует ещё не существующие строки: две
+        транзакции, добавляющие один и тот же ингредиент, обе дошли бы
+        до INSERT, и одна упала бы на уникальности. Поэтому недостающие
+        строки сначала вставляются пустыми с ignore_conflicts, а затем
+        все нужные строки блокируются и меняются.
+        """
+        if not user_ids or not deltas:
+            return
+
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=0,
+                    recipe_count=0,
+                )
+                for user_id in user_ids
+                for ingredient_id, (_, count) in deltas.items()
+                if count > 0
+            ),
+            ignore_conflicts=True,
+        )
+        to_update, to_delete = [], []
+        for item in self.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=deltas
+        ).order_by():
+            amount, count = deltas[item.ingredient_id]
+            item.total_amount += amount
+            item.recipe_count += count
+            if item.recipe_count > 0:
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+
+        self.bulk_update(to_update, ('total_amount', 'recipe_count'))
+        self.filter(pk__in=to_delete).delete()
+
+
+class ShoppingListItem(models.Model):
+    """Агрегат списка покупок: сумма ингредиента по корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+    recipe_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов'
+    )
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.ingredient.name}: {self.total_amount} '
+            f'{self.ingredient.measurement_unit} у {self.user}'
+        )
+
+
+class FeedManager(models.Manager):
+    """Ленты подписок, заполняемые при записи, а не при чтении.
+
+    Рецепт рассылается в ленты подписчиков после публикации, при
+    подписке в ленту добавляются все рецепты автора. Чтение ленты —
+    только выборка диапазона по индексу, без записей.
+    """
+
+    def fan_out(self, recipe):
+        """Рассылает рецепт в ленты подписчиков автора."""
+        follower_ids = (
+            Follow.objects.filter(following_id=recipe.author_id)
+            .values_list('user_id', flat=True)
+            .order_by()
+            .iterator()
+        )
+        pushed = 0
+        while True:
+            batch = list(
+                islice(follower_ids, settings.FEED_FANOUT_BATCH_SIZE)
+            )
+            if not batch:
+                return pushed
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id,
+                        recipe_id=recipe.pk,
+                        author_id=recipe.author_id,
+                        pub_date=recipe.pub_date,
+                    )
+                    for user_id in batch
+                ),
+                ignore_conflicts=True,
+            )
+            pushed += len(batch)
+
+    def add_author(self, user_id, author_id):
+        """Добавляет в ленту все рецепты нового автора.
+
+        Рецепты вставляются порциями по FEED_BACKFILL_SIZE, от новых
+        к старым; уже попавшие в ленту пропускаются.
+        """
+        recipes = (
+            Recipe.objects.filter(author_id=author_id)
+            .values_list('pk', 'pub_date')
+            .order_by('-pub_date', '-pk')
+            .iterator(chunk_size=settings.FEED_BACKFILL_SIZE)
+        )
+        added = 0
+        while True:
+            batch = list(islice(recipes, settings.FEED_BACKFILL_SIZE))
+            if not batch:
+                return added
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id,
+                        recipe_id=recipe_id,
+                        author_id=author_id,
+                        pub_date=pub_date,
+                    )
+                    for recipe_id, pub_date in batch
+                ),
+                ignore_conflicts=True,
+            )
+            added += len(batch)
+
+    def remove_author(self, user_id, author_id):
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def rebuild(self):
+        self.all().delete()
+        for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'following_id'
+        ).order_by():
+            self.add_author(user_id, author_id)
+
+    @staticmethod
+    def is_popular(author_id):
+        return Follow.objects.filter(following_id=author_id).order_by()[
+            settings.FEED_FANOUT_MAX_FOLLOWERS:
+        ].exists()
+
+
+class FeedItem(models.Model):
+    """Запись ленты подписок: рецепт автора, на которого подписан user."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    objects = FeedManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-id'),
+                name='feed_user_pub_date_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
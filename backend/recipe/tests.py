@@ -0,0 +1,159 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from .models import (Ingredient, IngredientRecipe, Recipe, ShoppingCart,
+                     ShoppingListItem, Tag)
+
+User = get_user_model()
+
+
+class ShoppingListTest(TestCase):
+    """Агрегат списка покупок совпадает с корзинами и рецептами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            first_name='admin', last_name='admin', password='password-123',
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer',
+            first_name='buyer', last_name='buyer', password='password-123',
+        )
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.flour, cls.milk = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Молоко')
+        )
+        cls.pancakes, cls.bread = (
+            Recipe.objects.create(
+                author=cls.admin, name=name, text='Текст', cooking_time=10,
+                image='recipes/image.jpg',
+            )
+            for name in ('Блины', 'Хлеб')
+        )
+        for recipe, ingredient, amount in (
+            (cls.pancakes, cls.flour, 200),
+            (cls.pancakes, cls.milk, 500),
+            (cls.bread, cls.flour, 400),
+        ):
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertListInSync(self):
+        actual = {
+            (row[0], row[1]): row[2:]
+            for row in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+            )
+        }
+        expected = {
+            (row['recipe__shopping_recipe__user'], row['ingredient']): (
+                row['total_amount'], row['recipe_count']
+            )
+            for row in ShoppingListItem.objects.get_expected()
+        }
+        self.assertEqual(actual, expected)
+        return actual
+
+    def add_to_cart(self, recipe):
+        ShoppingCart.objects.create(user=self.buyer, recipe=recipe)
+        ShoppingListItem.objects.add_recipe(self.buyer, recipe)
+
+    def test_row_created_by_concurrent_transaction(self):
+        """Строку, которой не было при чтении, вставила другая транзакция."""
+        self.add_to_cart(self.bread)
+        ShoppingListItem.objects.filter(user=self.buyer).delete()
+        manager_class = type(ShoppingListItem.objects)
+        bulk_create = manager_class.bulk_create
+
+        def concurrent_bulk_create(manager, objs, **kwargs):
+            ShoppingListItem.objects.create(
+                user=self.buyer, ingredient=self.flour,
+                total_amount=400, recipe_count=1,
+            )
+            return bulk_create(manager, objs, **kwargs)
+
+        ShoppingCart.objects.create(user=self.buyer, recipe=self.pancakes)
+        with mock.patch.object(
+            manager_class, 'bulk_create', concurrent_bulk_create
+        ):
+            ShoppingListItem.objects.add_recipe(self.buyer, self.pancakes)
+        items = self.assertListInSync()
+        self.assertEqual(items[(self.buyer.pk, self.flour.pk)], (600, 2))
+
+    def test_admin_cart_changes(self):
+        response = self.client.post('/admin/recipe/shoppingcart/add/', {
+            'user': self.buyer.pk, 'recipe': self.pancakes.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertListInSync()
+
+        cart = ShoppingCart.objects.get(user=self.buyer)
+        response = self.client.post(
+            f'/admin/recipe/shoppingcart/{cart.pk}/change/',
+            {'user': self.buyer.pk, 'recipe': self.bread.pk},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListInSync()
+
+        response = self.client.post('/admin/recipe/shoppingcart/', {
+            'action': 'delete_selected', '_selected_action': [cart.pk],
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertEqual(self.assertListInSync(), {})
+
+    def test_admin_ingredient_changes(self):
+        self.add_to_cart(self.pancakes)
+        item = IngredientRecipe.objects.get(
+            recipe=self.pancakes, ingredient=self.milk
+        )
+        response = self.client.post(
+            f'/admin/recipe/ingredientrecipe/{item.pk}/change/', {
+                'recipe': self.bread.pk, 'ingredient': self.milk.pk,
+                'amount': 300,
+            }
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListInSync()
+
+        response = self.client.post(
+            f'/admin/recipe/ingredientrecipe/{item.pk}/delete/',
+            {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListInSync()
+
+    def test_admin_recipe_inline_changes(self):
+        self.add_to_cart(self.pancakes)
+        items = list(IngredientRecipe.objects.filter(recipe=self.pancakes))
+        data = {
+            'author': self.admin.pk, 'name': 'Блины', 'text': 'Текст',
+            'cooking_time': 10, 'tags': [self.tag.pk],
+            'pub_date_0': '2024-01-01', 'pub_date_1': '12:00:00',
+            'recipes-TOTAL_FORMS': 2, 'recipes-INITIAL_FORMS': 2,
+            'recipes-MIN_NUM_FORMS': 1, 'recipes-MAX_NUM_FORMS': 1000,
+        }
+        for index, item in enumerate(items):
+            data.update({
+                f'recipes-{index}-id': item.pk,
+                f'recipes-{index}-recipe': self.pancakes.pk,
+                f'recipes-{index}-ingredient': item.ingredient_id,
+                f'recipes-{index}-amount': item.amount + 50,
+            })
+        data[f'recipes-{len(items) - 1}-DELETE'] = 'on'
+        response = self.client.post(
+            f'/admin/recipe/recipe/{self.pancakes.pk}/change/', data
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.pancakes.recipes.count(), 1)
+        self.assertListInSync()
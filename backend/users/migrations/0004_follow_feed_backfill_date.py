@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+def set_backfill_dates(apps, schema_editor):
+    """Ленты заполнялись не глубже FEED_BACKFILL_SIZE рецептов автора."""
+    Follow = apps.get_model('users', 'Follow')
+    FeedItem = apps.get_model('recipe', 'FeedItem')
+    Follow.objects.update(feed_backfill_date=models.Subquery(
+        FeedItem.objects.filter(
+            user_id=models.OuterRef('user_id'),
+            author_id=models.OuterRef('following_id'),
+        ).order_by('pub_date').values('pub_date')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0007_feed'),
+        ('users', '0003_user_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='feed_backfill_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Лента заполнена до'),
+        ),
+        migrations.RunPython(set_backfill_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:56
+
+from django.db import migrations
+
+
+def fill_feeds(apps, schema_editor):
+    """Ленты теперь заполняются при записи целиком: дописываем рецепты,
+    которые раньше подтягивались при чтении."""
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipe', 'Recipe')
+    FeedItem = apps.get_model('recipe', 'FeedItem')
+    for user_id, author_id in Follow.objects.values_list(
+        'user_id', 'following_id'
+    ).order_by():
+        FeedItem.objects.bulk_create(
+            (
+                FeedItem(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for recipe_id, pub_date in Recipe.objects.filter(
+                    author_id=author_id
+                ).values_list('pk', 'pub_date').order_by()
+            ),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_follow_feed_backfill_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='follow',
+            name='feed_backfill_date',
+        ),
+    ]
@@ -1,9 +1,32 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 
 from api.constants import (FIRST_NAME_LENGTH, LAST_NAME_LENGTH)
 
 
+class UserQuerySet(models.QuerySet):
+    """Кверисет пользователей с флагами, зависящими от зрителя."""
+
+    def with_is_subscribed(self, viewer):
+        """Аннотирует is_subscribed одним подзапросом вместо exists()
+        на каждого пользователя."""
+        if viewer is None or not viewer.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=models.BooleanField())
+            )
+        return self.annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(user=viewer, following=OuterRef('pk'))
+            )
+        )
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с методами UserQuerySet."""
+
+
 class User(AbstractUser):
     """Модель пользователя."""
 
@@ -15,6 +38,8 @@ class User(AbstractUser):
         'password'
     )
 
+    objects = UserManager()
+
     email = models.EmailField(
         verbose_name='Адрес электронной почты',
         unique=True,
@@ -39,6 +64,12 @@ class User(AbstractUser):
         blank=True,
         null=True,
     )
+    avatar_renditions = models.JSONField(
+        verbose_name='Уменьшенные копии аватара',
+        default=dict,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Пользователь'